@@ -1,6 +1,8 @@
 # ColorManager for Fractal Application
 # AND OTHER HELPER CLASSES
 import colorsys
+from decimal import Decimal
+import numpy as np
 
 NUM_COLORS = 120
 COLORS_CLASSIC = "CLASSIC"
@@ -8,25 +10,63 @@ COLORS_FOREST = "FOREST"
 COLORS_PASTEL = "PASTEL"
 # TO DO: add more color maps
 INITIAL_COLORMAP = "FOREST"
-
+COLORING_BANDS = "Bands" # one palette entry per integer escape count
+COLORING_SMOOTH = "Smooth" # continuous counts, palette interpolated between entries
+COLORING_EQUALIZED = "Equalized" # palette spread over the distribution of the counts
+INITIAL_ITERATIONS = 20
+MANDLEBROT = "Mandlebrot"
+JULIA = "Julia"
+
+# The plain data classes use __slots__: many Drawings live on the history stacks
 class ComplexPoint():
+    __slots__ = ("real", "imaginary")
+
     def __init__(self,r,i):
         self.real=r
         self.imaginary=i
 
 class ComplexRectangle():
+    __slots__ = ("rMax", "rMin", "iMax", "iMin", "precise")
+
     def __init__(self,rmax,rmin,imax,imin):
-        self.rMax=rmax
-        self.rMin=rmin
-        self.iMax=imax
-        self.iMin=imin
+        self.rMax=float(rmax)
+        self.rMin=float(rmin)
+        self.iMax=float(imax)
+        self.iMin=float(imin)
+        # Exact bounds for deep zooms, float64 runs out of precision below ~1e-13 per pixel
+        self.precise = None
+        if isinstance(rmax, Decimal):
+            self.precise = (rmax, rmin, imax, imin)
+
+    # (rMax, rMin, iMax, iMin) as Decimals, exact even when the rectangle was built from floats
+    def decimal_bounds(self):
+        if self.precise:
+            return self.precise
+        return (Decimal(self.rMax), Decimal(self.rMin), Decimal(self.iMax), Decimal(self.iMin))
+
+    # Hashable and exact, for cache keys
+    def key(self):
+        return tuple(str(bound) for bound in self.decimal_bounds())
+
+    # Significant digits needed to tell apart neighbouring pixels, with a safety margin
+    def precision(self, width):
+        rMax, rMin, iMax, iMin = self.decimal_bounds()
+        delta = (rMax - rMin) / width
+        return max(28, 20 - delta.adjusted() + max(rMax.adjusted(), rMin.adjusted(), iMax.adjusted(), iMin.adjusted(), 0))
+
+INITIAL_MANDLEBROT_RECTANGLE = ComplexRectangle( 1.5, -2.5, 2.0, -2.0 )
+INITIAL_JULIA_RECTANGLE = ComplexRectangle( 2.0, -2.0, 2.0, -2.0 )
 
 class PixelPoint():
+    __slots__ = ("x", "y")
+
     def __init__(self,_x,_y):
         self.x = _x
         self.y = _y
 
 class PixelRectangle():
+    __slots__ = ("xUL", "yUL", "width", "height")
+
     def __init__(self,x_ul,y_ul,w,h):
         self.xUL = x_ul
         self.yUL = y_ul
@@ -34,6 +74,9 @@ class PixelRectangle():
         self.height = h
 
 class Drawing():
+    __slots__ = ("image", "fractalRect", "zoomRect", "width", "height", "maxIterations", "cmName",
+                 "iterations", "smooth", "stats", "samples", "savedIterations", "formula", "antialias")
+
     def __init__(self,newImage,complexRect,w,h,maxIters,colorMap):
         self.image = newImage
         self.fractalRect = complexRect
@@ -42,15 +85,44 @@ class Drawing():
         self.height = h
         self.maxIterations = maxIters
         self.cmName = colorMap
+        self.iterations = None # per-pixel escape counts, shape (h, w)
+        self.smooth = False # continuous (float32) counts instead of integers, see escape_time
+        self.stats = None # RenderStats summary of the render that produced it, when profiled
+        self.samples = None # (pixel indices, sub-pixel counts) of antialiased edge pixels
+        self.savedIterations = None # where the counts are stored in a session file, see Session
+        self.formula = MANDLEBROT # name of the iterated formula (see Formulas), for a JuliaDrawing too
+        self.antialias = 1 # sub-pixel grid per side its edge pixels are refined with, 1 is off
+
+    def set_iterations(self,iterations):
+        # uint16 is enough for integer counts unless maxIterations is very large
+        if self.maxIterations <= np.iinfo(np.uint16).max and iterations.dtype.kind in "ui":
+            iterations = iterations.astype(np.uint16, copy=False)
+        self.iterations = iterations
 
     def set_zoom(self,pixelRect):
         self.zoomRect = pixelRect
+
+    # Identifies the rendered pixels: drawings with the same key have the same iteration counts
+    def cache_key(self):
+        return (type(self).__name__, self.formula, self.fractalRect.key(), self.maxIterations, self.width, self.height,
+                self.smooth)
+
+    # Drop the image and counts, a history entry keeps only its parameters (see RenderCache)
+    def release(self):
+        self.image = None
+        self.iterations = None
+        self.samples = None
         
 class JuliaDrawing(Drawing):
+    __slots__ = ("juliaPoint",)
+
     def __init__(self,newImage,complexRect,w,h,maxIters,colorMap,jp):
         super().__init__(newImage,complexRect,w,h,maxIters,colorMap)
         self.juliaPoint = jp
 
+    def cache_key(self):
+        return super().cache_key() + ((self.juliaPoint.real, self.juliaPoint.imaginary),)
+
 class Stack:
     def __init__(self):
         self.items = []
@@ -67,40 +139,84 @@ class Stack:
 
 class ColorManager():
     def __init__(self):
-        self.cmTable = {}
         self.currentCM = INITIAL_COLORMAP
+        self.coloring = COLORING_BANDS
+        self.setNumColors(NUM_COLORS)
+
+    # Each palette is a (numColors+1, 3) uint8 lookup table, the extra last entry is black
+    def build_tables(self, numColors):
+        lutTable = {}
 
         # CLASSIC
-        colorMap = {}
-        for colorNum in range(NUM_COLORS-1, -1, -1):
-            hue = (((colorNum * 2) % NUM_COLORS) / NUM_COLORS)
-            saturation = (((colorNum * 2) % NUM_COLORS) / NUM_COLORS)
+        colorMap = []
+        for colorNum in range(numColors):
+            hue = (((colorNum * 2) % numColors) / numColors)
+            saturation = (((colorNum * 2) % numColors) / numColors)
             brightness = 1.0
             red, green, blue = colorsys.hsv_to_rgb(hue, saturation, brightness)
-            color = (int(red * 255), int(green * 255), int(blue * 255))      
-            colorMap[colorNum] = color
-        self.cmTable[COLORS_CLASSIC] = colorMap
+            colorMap.append((int(red * 255), int(green * 255), int(blue * 255)))
+        lutTable[COLORS_CLASSIC] = np.array(colorMap + [(0, 0, 0)], dtype=np.uint8)
       
         # FOREST
-        colorMap = {}
-        for colorNum in range(NUM_COLORS-1, -1, -1):
-            red = ((1024 * colorNum / NUM_COLORS)) % 255
-            green = ((256 * colorNum / NUM_COLORS)) % 255
-            blue = ((512 * colorNum / NUM_COLORS)) % 255
-            color = int(red),int(green), int(blue)
-            colorMap[colorNum] = color
-        self.cmTable[COLORS_FOREST] = colorMap
+        colorMap = []
+        for colorNum in range(numColors):
+            red = ((1024 * colorNum / numColors)) % 255
+            green = ((256 * colorNum / numColors)) % 255
+            blue = ((512 * colorNum / numColors)) % 255
+            colorMap.append((int(red), int(green), int(blue)))
+        lutTable[COLORS_FOREST] = np.array(colorMap + [(0, 0, 0)], dtype=np.uint8)
 
         # PASTEL
-        colorMap = {}
-        for colorNum in range(NUM_COLORS-1, -1, -1):
-            hue = (((colorNum * 4) % NUM_COLORS) / NUM_COLORS)
-            saturation = (((colorNum * 2) % NUM_COLORS) / NUM_COLORS)
+        colorMap = []
+        for colorNum in range(numColors):
+            hue = (((colorNum * 4) % numColors) / numColors)
+            saturation = (((colorNum * 2) % numColors) / numColors)
             brightness = 1.0
             red, green, blue = colorsys.hsv_to_rgb(hue, saturation, brightness)
-            color = (int(red * 255), int(green * 255), int(blue * 255))      
-            colorMap[colorNum] = color
-        self.cmTable[COLORS_PASTEL] = colorMap
+            colorMap.append((int(red * 255), int(green * 255), int(blue * 255)))
+        lutTable[COLORS_PASTEL] = np.array(colorMap + [(0, 0, 0)], dtype=np.uint8)
+        return lutTable
+
+    # Map an array of escape counts to an (h, w, 3) RGB array in one LUT pass
+    # Same mapping as FractalCalculator.lookup_color, count 0 (never escaped) is black
+    # Smooth and equalized coloring sample the palette between its entries instead, equalized
+    # coloring uses the distribution of the counts in histogram (default: iterations themselves)
+    # The palette is read once, so a render thread never mixes the old color count with the new tables
+    def colorize(self, iterations, maxIterations, cmName=None, histogram=None):
+        numColors, lutTable = self.palette
+        if self.coloring == COLORING_BANDS:
+            table = lutTable[cmName or self.currentCM]
+            colorNums = (numColors * (1 - (iterations / maxIterations))).astype(np.intp)
+            colorNums[colorNums == numColors] = 0
+            colorNums[iterations == 0] = numColors
+            return table[colorNums]
+        if self.coloring == COLORING_EQUALIZED:
+            positions = numColors * (1 - self.equalize(iterations, iterations if histogram is None else histogram))
+        else:
+            positions = numColors * (1 - (iterations / maxIterations))
+        rgb = self.sample(positions, cmName, (numColors, lutTable))
+        rgb[iterations == 0] = 0
+        return rgb
+
+    # Share of the escaped counts of histogram below each count, from 0 to 1
+    def equalize(self, iterations, histogram):
+        escaped = np.sort(histogram[histogram != 0], axis=None)
+        if escaped.size == 0:
+            return np.zeros(np.shape(iterations))
+        return np.searchsorted(escaped, iterations) / escaped.size
+
+    # The palette at any resolution: colors at fractional positions 0 .. numColors, linearly
+    # interpolated between neighbouring entries, the last entry blends back into the first
+    def sample(self, positions, cmName=None, palette=None):
+        numColors, lutTable = palette or self.palette
+        table = lutTable[cmName or self.currentCM][:-1].astype(np.float32)
+        positions = np.mod(positions, numColors)
+        lower = positions.astype(np.intp)
+        lower[lower == numColors] = 0 # mod of a tiny negative number rounds up to numColors
+        fraction = (positions - lower)[..., np.newaxis]
+        upper = lower + 1
+        upper[upper == numColors] = 0
+        return (table[lower] * (1 - fraction) + table[upper] * fraction + 0.5).astype(np.uint8)
 
     def initialColorMap(self):
         return INITIAL_COLORMAP
@@ -108,12 +224,29 @@ class ColorManager():
     def listOfColorMaps(self):
         return [COLORS_CLASSIC,COLORS_FOREST,COLORS_PASTEL]
 
+    def listOfColorings(self):
+        return [COLORING_BANDS, COLORING_SMOOTH, COLORING_EQUALIZED]
+
+    def setColoring(self, coloring):
+        self.coloring = coloring
+
+    # Continuous counts only pay off for the colorings that interpolate the palette
+    def wantsSmooth(self):
+        return self.coloring != COLORING_BANDS
+
     def lookup(self, colorNum):
-        colorMap = self.cmTable[self.currentCM]
-        return colorMap[colorNum]
+        color = self.palette[1][self.currentCM][colorNum]
+        return (int(color[0]), int(color[1]), int(color[2]))
+
+    def lut(self, cmName=None):
+        return self.palette[1][cmName or self.currentCM][:-1]
 
     def numColors(self):
-        return NUM_COLORS 
+        return self.palette[0]
 
     def setCM(self, cmName):
         self.currentCM = cmName
+
+    # (numColors, lookup tables by name), replaced as a whole
+    def setNumColors(self, numColors):
+        self.palette = (numColors, self.build_tables(numColors))
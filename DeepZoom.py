@@ -0,0 +1,202 @@
+# DeepZoom for Fractal Application
+# Perturbation rendering for zooms where float64 pixel coordinates run out of precision
+# One reference orbit is computed in Decimal, every pixel iterates only its float64 offset dz from it:
+#   z = Z + dz,  dz' = (2Z + dz) dz + dc   (dc = 0 for Julia sets)
+# Rebasing (dz = z - Z_0 whenever |z| < |dz|) keeps dz accurate, pixels that outlive the reference
+# orbit are glitched and get recomputed against a new reference picked among them
+# A cubic series approximation of dz skips the early iterations shared by the whole viewport
+import decimal
+from decimal import Decimal
+import numpy as np
+from FractalCalculator import MandlebrotCalculator, JuliaCalculator, RenderCancelled, smooth_count
+
+DEEP_ZOOM_DELTA = 1e-13 # pixel size below which the app switches to perturbation
+MAX_REFERENCES = 8 # references tried per compute call before glitched pixels are accepted as is
+SERIES_TOLERANCE = 1e-9 # allowed cubic term of the series, relative to its linear term
+
+def needs_deep_zoom(drawing):
+    rMax, rMin, iMax, iMin = drawing.fractalRect.decimal_bounds()
+    return (rMax - rMin) / drawing.width < DEEP_ZOOM_DELTA
+
+# Shared by DeepMandlebrotCalculator and DeepJuliaCalculator
+# Pixels are referred to by (possibly fractional) pixel coordinates, references too
+class PerturbationCalculator():
+    # Index of the pixel's first z in the reference orbit, and whether dc is added each step
+    startIndex = 0
+    addsOffset = False
+    symmetryKind = None # pixels are perturbations of a reference orbit, mirrored pixels are not exact opposites
+
+    def init_perturbation(self):
+        self.orbits = {}
+        for name in ("seriesIterations", "rebases", "glitches", "references"):
+            self.shortcuts[name] = 0
+
+    # Deep calculators carry their (large) orbit cache, so workers do not recompute the main reference
+    def prepare(self):
+        self.reference_orbit(*self.center_pixel())
+
+    def pixel_delta(self):
+        rMax, rMin, iMax, iMin = self.drawing.fractalRect.decimal_bounds()
+        return (rMax - rMin) / self.drawing.width
+
+    def center_pixel(self):
+        rMax, rMin, iMax, iMin = self.drawing.fractalRect.decimal_bounds()
+        with decimal.localcontext() as context:
+            context.prec = self.drawing.fractalRect.precision(self.drawing.width)
+            delta = self.pixel_delta()
+            return (self.drawing.width / 2, self.drawing.height - float((iMax - iMin) / 2 / delta))
+
+    # Exact complex value of a pixel position: same mapping as calc_color
+    def pixel_value(self, x, y):
+        rMax, rMin, iMax, iMin = self.drawing.fractalRect.decimal_bounds()
+        delta = self.pixel_delta()
+        return (rMin + Decimal(float(x)) * delta, iMin + (self.drawing.height - Decimal(float(y))) * delta)
+
+    # Reference orbit Z_0 .. Z_n as complex128, stops after maxIterations or right after escaping
+    # Cached by exact value, previews of the same drawing share the main reference
+    def reference_orbit(self, x, y):
+        with decimal.localcontext() as context:
+            context.prec = self.drawing.fractalRect.precision(self.drawing.width)
+            key = self.pixel_value(x, y)
+            if key not in self.orbits:
+                self.orbits[key] = self.orbit_from(*key)
+                self.shortcuts["references"] += 1
+        return self.orbits[key]
+
+    def decimal_orbit(self, zR, zI, cR, cI, length):
+        orbit = [complex(float(zR), float(zI))]
+        for n in range(1, length):
+            if self.cancel is not None and self.cancel():
+                raise RenderCancelled()
+            zR, zI = zR * zR - zI * zI + cR, 2 * zR * zI + cI
+            orbit.append(complex(float(zR), float(zI)))
+            if zR * zR + zI * zI >= 4:
+                break
+        return np.array(orbit)
+
+    # Iterations the whole viewport can skip: the last orbit index where the cubic series
+    # A dc + B dc^2 + C dc^3 is accurate for every |dc| <= radius and no pixel can have escaped yet
+    def series_skip(self, orbit, radius):
+        n = self.startIndex
+        a, b, c = 1, 0, 0
+        limit = min(len(orbit) - 2, self.drawing.maxIterations - 1)
+        while n < limit:
+            z = orbit[n]
+            nextA = 2 * z * a + (1 if self.addsOffset else 0)
+            nextB = 2 * z * b + a * a
+            nextC = 2 * z * c + 2 * a * b
+            linear = abs(nextA) * radius
+            cubic = abs(nextC) * radius ** 3
+            if cubic > SERIES_TOLERANCE * linear:
+                break
+            if linear + abs(nextB) * radius ** 2 + cubic >= 2 - abs(orbit[n + 1]):
+                break
+            a, b, c = nextA, nextB, nextC
+            n += 1
+        return n, a, b, c
+
+    # No interior shortcuts here, interior is left as it is
+    def compute_points(self, xs, ys, interior=None):
+        xs, ys = np.broadcast_arrays(xs, ys)
+        shape = xs.shape
+        xs = xs.ravel().astype(np.float64)
+        ys = ys.ravel().astype(np.float64)
+        delta = float(self.pixel_delta())
+        counts = np.zeros(xs.size, dtype=self.count_dtype())
+        pending = np.arange(xs.size)
+        refX, refY = self.center_pixel()
+        for attempt in range(MAX_REFERENCES):
+            orbit = self.reference_orbit(refX, refY)
+            dc = ((xs[pending] - refX) + 1j * (refY - ys[pending])) * delta
+            final = attempt == MAX_REFERENCES - 1
+            # The series skip only uses the main reference and the whole drawing's radius,
+            # so every tile of a drawing skips the same iterations
+            skip = attempt == 0
+            pendingCounts, glitched = self.perturb(orbit, dc, delta, skip, final)
+            counts[pending] = pendingCounts
+            pending = pending[glitched]
+            if pending.size == 0:
+                break
+            self.shortcuts["glitches"] += int(pending.size)
+            middle = pending[pending.size // 2]
+            refX, refY = float(xs[middle]), float(ys[middle])
+        return counts.reshape(shape)
+
+    # Escape counts for pixel offsets dc from the reference, plus a mask of glitched pixels
+    def perturb(self, orbit, dc, delta, skip, final):
+        maxIterations = self.drawing.maxIterations
+        counts = np.zeros(dc.size, dtype=self.count_dtype())
+        glitched = np.zeros(dc.size, dtype=bool)
+        active = np.arange(dc.size)
+        m = np.full(dc.size, self.startIndex)
+        dz = dc.copy()
+        first = 1
+        if skip:
+            width, height = self.drawing.width, self.drawing.height
+            refX, refY = self.center_pixel()
+            radius = delta * max(abs(complex(x - refX, refY - y)) for x in (0, width) for y in (0, height))
+            n, a, b, c = self.series_skip(orbit, radius)
+            if n > self.startIndex:
+                dz = ((c * dc + b) * dc + a) * dc
+                m[:] = n
+                first += n - self.startIndex
+                self.shortcuts["seriesIterations"] += int(dc.size) * (n - self.startIndex)
+        last = len(orbit) - 1
+        z0 = orbit[0]
+        if not self.addsOffset:
+            dc = 0
+        for i in range(first, maxIterations):
+            if self.cancel is not None and self.cancel():
+                raise RenderCancelled()
+            dz = (2 * orbit[m] + dz) * dz + dc
+            m += 1
+            z = orbit[m] + dz
+            distSquared = z.real * z.real + z.imag * z.imag
+            done = distSquared >= 4
+            if self.drawing.smooth:
+                counts[active[done]] = smooth_count(i, distSquared[done])
+            else:
+                counts[active[done]] = i
+            rebase = ~done & (distSquared < dz.real * dz.real + dz.imag * dz.imag)
+            # Pixels still going at the end of an escaped reference orbit
+            atEnd = ~done & (m == last) & (i + 1 < maxIterations)
+            if not final:
+                glitched[active[atEnd]] = True
+                done |= atEnd
+            else:
+                rebase |= atEnd
+            if rebase.any():
+                self.shortcuts["rebases"] += int(np.count_nonzero(rebase))
+                dz[rebase] = z[rebase] - z0
+                m[rebase] = 0
+            if done.any():
+                keep = ~done
+                active = active[keep]
+                if active.size == 0:
+                    break
+                dz = dz[keep]
+                m = m[keep]
+                if self.addsOffset:
+                    dc = dc[keep]
+        return counts, glitched
+
+class DeepMandlebrotCalculator(PerturbationCalculator, MandlebrotCalculator):
+    # The orbit starts at Z_0 = 0 so that rebasing to its start is exact, pixels start at Z_1 = c
+    startIndex = 1
+    addsOffset = True
+
+    def __init__(self,newDrawing):
+        super().__init__(newDrawing)
+        self.init_perturbation()
+
+    def orbit_from(self, cR, cI):
+        return self.decimal_orbit(Decimal(0), Decimal(0), cR, cI, self.drawing.maxIterations + 1)
+
+class DeepJuliaCalculator(PerturbationCalculator, JuliaCalculator):
+    def __init__(self,newDrawing):
+        super().__init__(newDrawing)
+        self.init_perturbation()
+
+    def orbit_from(self, zR, zI):
+        jp = self.drawing.juliaPoint
+        return self.decimal_orbit(zR, zI, Decimal(jp.real), Decimal(jp.imaginary), self.drawing.maxIterations)
@@ -0,0 +1,146 @@
+# Formulas for Fractal Application
+# Registry of escape-time formulas z -> f(z) + c, each with a parameter plane (z starts at c, like the
+# Mandlebrot set) and a Julia variant (z starts at the pixel, c is the Julia point)
+# A formula is registered with a step on arrays of (zR, zI), which becomes its kernel: the vectorized
+# escape_time loop of the Mandlebrot engine, so every formula renders at the same per-pixel speed
+# The GUI menu, the command line tools and saved sessions all look fractals up by name here
+import functools
+import numpy as np
+from ColorManager import *
+from FractalCalculator import FractalCalculator, MandlebrotCalculator, JuliaCalculator, escape_time
+from FractalCalculator import SYMMETRY_CONJUGATE, SYMMETRY_POINT
+
+MULTIBROT = "Multibrot %d"
+BURNING_SHIP = "Burning Ship"
+TRICORN = "Tricorn"
+JULIA_SUFFIX = " Julia"
+
+class Formula():
+    def __init__(self, name, juliaName, kernel, symmetry, juliaSymmetry, rect, juliaRect,
+                 calculatorClass, juliaCalculatorClass, flipped):
+        self.name = name
+        self.juliaName = juliaName
+        self.kernel = kernel # escape_time for this formula
+        self.symmetry = symmetry # symmetryKind of the parameter plane and of the Julia sets
+        self.juliaSymmetry = juliaSymmetry
+        self.rect = rect # initial views
+        self.juliaRect = juliaRect
+        self.calculatorClass = calculatorClass
+        self.juliaCalculatorClass = juliaCalculatorClass
+        self.flipped = flipped # shown with the imaginary axis pointing down
+
+FORMULAS = {} # name -> Formula, in menu order
+
+# step(zR, zI, cR, cI) -> (zR, zI) computes f(z) + c on arrays; None is the built-in z^2 + c
+# degree: of f, for smooth coloring; symmetries: SYMMETRY_CONJUGATE, SYMMETRY_POINT or None, they must
+# hold exactly in float64 (see FractalCalculator.symmetry_plan)
+# flipped: draw both planes upside down, for formulas conventionally shown that way
+def register_formula(name, step, degree=2, symmetry=None, juliaSymmetry=None, juliaName=None,
+                     rect=INITIAL_MANDLEBROT_RECTANGLE, juliaRect=INITIAL_JULIA_RECTANGLE,
+                     calculatorClass=None, juliaCalculatorClass=None, flipped=False):
+    kernel = functools.partial(escape_time, step=step, degree=degree)
+    formula = Formula(name, juliaName or name + JULIA_SUFFIX, kernel, symmetry, juliaSymmetry, rect, juliaRect,
+                      calculatorClass or FormulaCalculator, juliaCalculatorClass or FormulaJuliaCalculator, flipped)
+    FORMULAS[name] = formula
+    return formula
+
+# Menu entries: every formula and its Julia variant
+def fractal_names():
+    names = []
+    for formula in FORMULAS.values():
+        names.extend([formula.name, formula.juliaName])
+    return names
+
+# (Formula, True for the Julia variant) of a menu entry
+def find_fractal(fractalName):
+    for formula in FORMULAS.values():
+        if fractalName == formula.name:
+            return formula, False
+        if fractalName == formula.juliaName:
+            return formula, True
+    raise ValueError("Unknown fractal: " + fractalName)
+
+# Menu entry of a drawing, the inverse of new_drawing
+def fractal_name(drawing):
+    formula = FORMULAS[drawing.formula]
+    if isinstance(drawing, JuliaDrawing):
+        return formula.juliaName
+    return formula.name
+
+def new_drawing(fractalName, image, complexRect, w, h, maxIterations, cmName, juliaPoint=None):
+    formula, julia = find_fractal(fractalName)
+    if julia:
+        drawing = JuliaDrawing(image, complexRect, w, h, maxIterations, cmName, juliaPoint)
+    else:
+        drawing = Drawing(image, complexRect, w, h, maxIterations, cmName)
+    drawing.formula = formula.name
+    return drawing
+
+# True when the drawing's imaginary axis points down the image (see FractalCalculator.complex_grid)
+def flipped_view(drawing):
+    return FORMULAS[drawing.formula].flipped
+
+# Initial view of a menu entry
+def initial_rectangle(fractalName):
+    formula, julia = find_fractal(fractalName)
+    return formula.juliaRect if julia else formula.rect
+
+# The Drawing of another view of the same fractal
+def same_fractal(drawing, image, complexRect, w, h, maxIterations, cmName):
+    return new_drawing(fractal_name(drawing), image, complexRect, w, h, maxIterations, cmName,
+                       getattr(drawing, "juliaPoint", None))
+
+# Calculators keep the formula's name, not the Formula, so they pickle for the worker processes
+class FormulaCalculator(FractalCalculator):
+    def __init__(self,newDrawing):
+        super().__init__(newDrawing)
+        self.symmetryKind = FORMULAS[newDrawing.formula].symmetry
+        self.flipImaginary = FORMULAS[newDrawing.formula].flipped
+
+    # Scalar reference through the kernel, one point at a time
+    def test_point(self, cR, cI, maxIterations):
+        return self.iterate(np.array([cR], dtype=np.float64), np.array([cI], dtype=np.float64), maxIterations)[0]
+
+    def iterate(self, cR, cI, maxIterations, interior=None):
+        kernel = FORMULAS[self.drawing.formula].kernel
+        return kernel(cR.copy(), cI.copy(), cR, cI, maxIterations, self.cancel, self.tolerance(), self.shortcuts,
+                      self.drawing.smooth, interior=interior)
+
+class FormulaJuliaCalculator(FormulaCalculator):
+    def __init__(self,newDrawing):
+        super().__init__(newDrawing)
+        self.symmetryKind = FORMULAS[newDrawing.formula].juliaSymmetry
+
+    def iterate(self, zR, zI, maxIterations, interior=None):
+        kernel = FORMULAS[self.drawing.formula].kernel
+        jp = self.drawing.juliaPoint
+        return kernel(zR, zI, jp.real, jp.imaginary, maxIterations, self.cancel, self.tolerance(), self.shortcuts,
+                      self.drawing.smooth, interior=interior)
+
+# z^n + c by repeated complex multiplication; odd powers have no point symmetry (f(-z) = -z^n + c)
+def multibrot_step(power):
+    def step(zR, zI, cR, cI):
+        wR = zR
+        wI = zI
+        for n in range(power - 1):
+            wR, wI = wR * zR - wI * zI, wR * zI + wI * zR
+        return wR + cR, wI + cI
+    return step
+
+# (|zR| + i|zI|)^2 + c, shown flipped so the ship sits upright
+def burning_ship_step(zR, zI, cR, cI):
+    return zR * zR - zI * zI + cR, 2 * np.abs(zR * zI) + cI
+
+# conj(z)^2 + c
+def tricorn_step(zR, zI, cR, cI):
+    return zR * zR - zI * zI + cR, -2 * zR * zI + cI
+
+# z^2 + c keeps its own calculators: interior checks, and the perturbation engine for deep zooms (see make_calculator)
+register_formula(MANDLEBROT, None, symmetry=SYMMETRY_CONJUGATE, juliaSymmetry=SYMMETRY_POINT, juliaName=JULIA,
+                 calculatorClass=MandlebrotCalculator, juliaCalculatorClass=JuliaCalculator)
+for power in (3, 4, 5):
+    register_formula(MULTIBROT % power, multibrot_step(power), degree=power, symmetry=SYMMETRY_CONJUGATE,
+                     juliaSymmetry=SYMMETRY_POINT if power % 2 == 0 else None, rect=INITIAL_JULIA_RECTANGLE)
+register_formula(BURNING_SHIP, burning_ship_step, juliaSymmetry=SYMMETRY_POINT, flipped=True)
+register_formula(TRICORN, tricorn_step, symmetry=SYMMETRY_CONJUGATE, juliaSymmetry=SYMMETRY_POINT,
+                 rect=INITIAL_JULIA_RECTANGLE)
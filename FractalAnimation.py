@@ -0,0 +1,195 @@
+### FRACTAL ANIMATION - HEADLESS
+# Renders a zoom-in sequence centered on a target point, one frame per zoom step
+# Frames are rendered in groups on a pool of worker processes and written in order as soon as
+# each group is done, while the workers already render the next ones
+# With --keyframes K only every K-th frame is rendered (at --keyframe-scale times the resolution),
+# the frames in between are cropped from it and rescaled
+#   python FractalAnimation.py frames/ --target=-0.743643887037151,0.131825904205330 --zoom 1.05 --frames 300
+#   python FractalAnimation.py zoom.rgb ...   (raw RGB24 video, e.g. for ffmpeg -f rawvideo)
+import argparse
+import collections
+import decimal
+import multiprocessing
+import os
+import sys
+import time
+from decimal import Decimal
+import numpy as np
+from ColorManager import *
+from FractalRenderer import ZOOM_LIMIT_DELTA, limit_zoom, make_calculator, make_rectangle, guess_max_iterations
+from FractalRenderer import parse_pair, parse_size
+from FractalRenderer import write_png, write_ppm
+from Formulas import find_fractal, fractal_names, new_drawing
+
+PROGRESS_FRAMES = 10 # report throughput every this many frames
+GROUPS_PER_WORKER = 2 # frame groups in flight per worker, finished frames wait in memory until written
+
+# Complex width of frame number frameNum
+def frame_width(startWidth, zoomFactor, frameNum):
+    startWidth = Decimal(startWidth)
+    with decimal.localcontext() as context:
+        context.prec = 30
+        return startWidth / Decimal(zoomFactor) ** frameNum
+
+def frame_rectangle(spec, frameNum, width, height):
+    return make_rectangle(spec["target"][0], spec["target"][1],
+                          frame_width(spec["startWidth"], spec["zoom"], frameNum), width, height)
+
+# Number of frames before the first one limit_zoom widens: past it every frame would repeat the limit
+def frames_before_limit(spec, frames):
+    width, height = spec["size"]
+    for frameNum in range(frames):
+        complexRect = frame_rectangle(spec, frameNum, width, height)
+        if limit_zoom(spec["fractal"], complexRect, width, height) is not complexRect:
+            return frameNum
+    return frames
+
+def make_frame_drawing(spec, frameNum, width, height):
+    complexRect = limit_zoom(spec["fractal"], frame_rectangle(spec, frameNum, width, height), width, height)
+    maxIterations = int(guess_max_iterations(complexRect))
+    if find_fractal(spec["fractal"])[1]:
+        maxIterations *= 2 # Double the iterations for julia sets, as the GUI does
+    juliaPoint = ComplexPoint(float(spec["julia"][0]), float(spec["julia"][1]))
+    return new_drawing(spec["fractal"], None, complexRect, width, height, maxIterations, spec["colormap"], juliaPoint)
+
+def render_rgb(drawing, spec):
+    colorManager = ColorManager()
+    colorManager.setNumColors(spec["colors"])
+    colorManager.setColoring(spec["coloring"])
+    drawing.smooth = colorManager.wantsSmooth()
+    calculator = make_calculator(drawing)
+    calculator.subdivide = spec["subdivide"]
+    iterations = calculator.compute_iterations()
+    return colorManager.colorize(iterations, drawing.maxIterations, drawing.cmName)
+
+# The central part (ratio of the width) of an image, bilinearly rescaled to width x height
+def zoom_crop(rgb, ratio, width, height):
+    sourceHeight, sourceWidth = rgb.shape[0], rgb.shape[1]
+    u = sourceWidth / 2 + (np.arange(width) + 0.5 - width / 2) * (sourceWidth * ratio / width) - 0.5
+    v = sourceHeight / 2 + (np.arange(height) + 0.5 - height / 2) * (sourceHeight * ratio / height) - 0.5
+    u = np.clip(u, 0, sourceWidth - 1)
+    v = np.clip(v, 0, sourceHeight - 1)
+    u0 = np.minimum(u.astype(np.intp), sourceWidth - 2) if sourceWidth > 1 else np.zeros(width, np.intp)
+    v0 = np.minimum(v.astype(np.intp), sourceHeight - 2) if sourceHeight > 1 else np.zeros(height, np.intp)
+    fu = (u - u0)[np.newaxis, :, np.newaxis]
+    fv = (v - v0)[:, np.newaxis, np.newaxis]
+    u1 = np.minimum(u0 + 1, sourceWidth - 1)
+    v1 = np.minimum(v0 + 1, sourceHeight - 1)
+    source = rgb.astype(np.float32)
+    top = source[v0][:, u0] * (1 - fu) + source[v0][:, u1] * fu
+    bottom = source[v1][:, u0] * (1 - fu) + source[v1][:, u1] * fu
+    return np.rint(top * (1 - fv) + bottom * fv).astype(np.uint8)
+
+# Worker task: the frames firstFrame .. firstFrame+count-1, rendered or interpolated from a keyframe
+def render_frame_group(task):
+    spec, firstFrame, count = task
+    width, height = spec["size"]
+    if count == 1 and spec["keyframeScale"] == 1:
+        return [render_rgb(make_frame_drawing(spec, firstFrame, width, height), spec)]
+    scale = spec["keyframeScale"]
+    keyframe = render_rgb(make_frame_drawing(spec, firstFrame, int(width * scale), int(height * scale)), spec)
+    zoomFactor = float(spec["zoom"])
+    return [zoom_crop(keyframe, zoomFactor ** -step, width, height) for step in range(count)]
+
+# function(task) for each task, in order, with at most window tasks submitted and not yet taken:
+# a slow writer holds back the pool instead of letting finished frames pile up
+def ordered_results(pool, function, tasks, window):
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(pool.apply_async(function, (task,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+class FrameWriter():
+    def __init__(self, output, frameFormat, width, height):
+        self.width = width
+        self.height = height
+        self.frameFormat = frameFormat
+        self.stream = None
+        self.directory = None
+        if output == "-":
+            self.stream = sys.stdout.buffer
+        elif output.lower().endswith(".rgb"):
+            self.stream = open(output, "wb")
+        else:
+            self.directory = output
+            os.makedirs(output, exist_ok=True)
+
+    def write(self, frameNum, rgb):
+        if self.stream is not None:
+            self.stream.write(rgb.tobytes())
+            return
+        path = os.path.join(self.directory, "frame_%05d.%s" % (frameNum, self.frameFormat))
+        writer = write_png if self.frameFormat == "png" else write_ppm
+        writer(path, self.width, self.height, [rgb])
+
+    def close(self):
+        if self.stream is not None and self.stream is not sys.stdout.buffer:
+            self.stream.close()
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Render a zoom-in animation without Qt")
+    parser.add_argument("output", help="frame directory, a .rgb raw video file, or - for raw video on stdout")
+    parser.add_argument("--target", type=parse_pair, required=True, help="zoom target R,I")
+    parser.add_argument("--zoom", default="1.05", help="zoom factor per frame")
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--start-width", default="4", help="complex width of the first frame")
+    parser.add_argument("--fractal", choices=fractal_names(), default=MANDLEBROT)
+    parser.add_argument("--julia", type=parse_pair, default=("0", "0"), help="Julia point R,I")
+    parser.add_argument("--size", type=parse_size, default=(640, 480), help="frame size WxH")
+    parser.add_argument("--colormap", default=INITIAL_COLORMAP, choices=ColorManager().listOfColorMaps())
+    parser.add_argument("--colors", type=int, default=NUM_COLORS, help="palette size")
+    parser.add_argument("--coloring", default=COLORING_BANDS, choices=ColorManager().listOfColorings())
+    parser.add_argument("--format", choices=["png", "ppm"], default="png", help="numbered frame format")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (0: one per CPU core)")
+    parser.add_argument("--subdivide", action="store_true", help="Mariani-Silver subdivision")
+    parser.add_argument("--keyframes", type=int, default=1, help="render every K-th frame, interpolate the rest")
+    parser.add_argument("--keyframe-scale", type=float, default=1.0, help="keyframe resolution multiplier")
+    return parser
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    spec = {
+        "target": args.target, "zoom": args.zoom, "startWidth": args.start_width,
+        "fractal": args.fractal, "julia": args.julia, "size": args.size,
+        "colormap": args.colormap, "colors": args.colors, "coloring": args.coloring, "subdivide": args.subdivide,
+        "keyframeScale": args.keyframe_scale,
+    }
+    numFrames = frames_before_limit(spec, args.frames)
+    if numFrames < args.frames:
+        numFrames = max(1, numFrames)
+        print("%s has no deep zoom engine, stopping after %d of %d frames at a pixel size of %.3g"
+              % (args.fractal, numFrames, args.frames, ZOOM_LIMIT_DELTA), file=sys.stderr)
+    groupSize = max(1, args.keyframes)
+    tasks = [(spec, first, min(groupSize, numFrames - first)) for first in range(0, numFrames, groupSize)]
+    writer = FrameWriter(args.output, args.format, *args.size)
+    workers = args.workers or os.cpu_count() or 1
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    start = time.perf_counter()
+    frameNum = 0
+    try:
+        # Frames come in order, the pool keeps rendering a bounded number of groups ahead while earlier ones are written
+        if pool is not None:
+            groups = ordered_results(pool, render_frame_group, tasks, GROUPS_PER_WORKER * workers)
+        else:
+            groups = map(render_frame_group, tasks)
+        for frames in groups:
+            for rgb in frames:
+                writer.write(frameNum, rgb)
+                frameNum += 1
+                if frameNum % PROGRESS_FRAMES == 0:
+                    seconds = time.perf_counter() - start
+                    print("frame %d/%d, %.2f frames/s" % (frameNum, numFrames, frameNum / seconds), file=sys.stderr)
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+    seconds = time.perf_counter() - start
+    print("Wrote %d frames in %.2f s, %.2f frames/s" % (frameNum, seconds, frameNum / seconds if seconds else 0.0), file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
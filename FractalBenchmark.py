@@ -0,0 +1,228 @@
+### FRACTAL BENCHMARK - HEADLESS
+# Times every engine on a fixed set of viewports, sizes and maxIterations,
+# plus color mapping and the zoom maths, and compares the results with a stored baseline
+#   python FractalBenchmark.py --save baseline.json
+#   python FractalBenchmark.py --baseline baseline.json --threshold 0.2   (exit status 1 on a regression)
+# Rates are the best of --repeat runs. iterations/s counts the escape-time work a pixel stands for
+# (its count, or maxIterations when it never escapes), so engines that skip work score higher
+# "scalar" is the pure Python loop of z^2 + c only, the registry formulas have no scalar loop
+# (their test_point is one numpy kernel call per point)
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+from ColorManager import *
+from FractalCalculator import MandlebrotCalculator
+from DeepZoom import DeepMandlebrotCalculator, DeepJuliaCalculator
+from FractalRenderer import make_rectangle, zoom_rectangle
+from Formulas import BURNING_SHIP, FORMULAS, JULIA_SUFFIX, MULTIBROT, TRICORN, find_fractal, new_drawing
+from TileRenderer import TileRenderer
+
+BENCHMARK_JULIA_POINT = ComplexPoint(-0.12, 0.75)
+SCALAR_SAMPLE_PIXELS = 2000 # the scalar engine only times a regular subsample of the pixels
+
+# name -> (fractal, rectangle, float64 engines can resolve it)
+VIEWPORTS = {
+    "mandlebrot-initial": (MANDLEBROT, INITIAL_MANDLEBROT_RECTANGLE, True),
+    "julia-initial": (JULIA, INITIAL_JULIA_RECTANGLE, True),
+    "seahorse-valley": (MANDLEBROT, make_rectangle("-0.7436438870", "0.1318259042", "0.005", 1, 1), True),
+    "mostly-interior": (MANDLEBROT, make_rectangle("-0.15", "0", "0.5", 1, 1), True),
+    "deep-zoom": (MANDLEBROT, make_rectangle("-0.1", "0.8780599594174949615204539533", "1e-18", 1, 1), False),
+    "multibrot3-initial": (MULTIBROT % 3, INITIAL_JULIA_RECTANGLE, True),
+    "burning-ship-initial": (BURNING_SHIP, INITIAL_MANDLEBROT_RECTANGLE, True),
+    "tricorn-julia-initial": (TRICORN + JULIA_SUFFIX, INITIAL_JULIA_RECTANGLE, True),
+}
+ENGINES = ["scalar", "numpy", "shortcuts", "symmetry", "subdivide", "tiled", "perturbation"]
+SIZES = [100, 200]
+ITERATIONS = [200, 1000]
+
+def make_drawing(viewport, size, maxIterations):
+    fractal, complexRect, shallow = VIEWPORTS[viewport]
+    return new_drawing(fractal, None, complexRect, size, size, maxIterations, INITIAL_COLORMAP, BENCHMARK_JULIA_POINT)
+
+def make_engine_calculator(engine, drawing):
+    julia = isinstance(drawing, JuliaDrawing)
+    if engine == "perturbation":
+        return DeepJuliaCalculator(drawing) if julia else DeepMandlebrotCalculator(drawing)
+    formula = FORMULAS[drawing.formula]
+    calculator = formula.juliaCalculatorClass(drawing) if julia else formula.calculatorClass(drawing)
+    # "numpy" is the plain vectorized engine, the other engines build on the interior shortcuts
+    if engine in ("numpy", "scalar"):
+        calculator.cardioidCheck = False
+        calculator.periodicityCheck = False
+    calculator.subdivide = engine == "subdivide"
+    calculator.symmetry = engine == "symmetry" # "symmetry" is "shortcuts" plus mirroring
+    return calculator
+
+# Runs one engine once, returns (seconds, iteration counts of the pixels it computed)
+def run_engine(engine, drawing, tileRenderer):
+    calculator = make_engine_calculator(engine, drawing)
+    if engine == "scalar":
+        stride = max(1, int((drawing.width * drawing.height / SCALAR_SAMPLE_PIXELS) ** 0.5))
+        start = time.perf_counter()
+        counts = []
+        for y in range(0, drawing.height, stride):
+            for x in range(0, drawing.width, stride):
+                zR, zI = calculator.complex_grid(x, y)
+                counts.append(calculator.test_point(zR, zI, drawing.maxIterations))
+        return time.perf_counter() - start, np.array(counts)
+    start = time.perf_counter()
+    if engine == "tiled":
+        counts = tileRenderer.compute_iterations(calculator)
+    else:
+        counts = calculator.compute_iterations()
+    return time.perf_counter() - start, counts
+
+# Starts the pool and has every worker compute a tile untimed, so the process startup
+# does not land on the first viewport
+def warm_up(tileRenderer):
+    tileRenderer.start()
+    size = tileRenderer.tileSize
+    drawing = make_drawing("mandlebrot-initial", size, min(ITERATIONS))
+    drawing.width = size * tileRenderer.numWorkers
+    tileRenderer.compute_iterations(make_engine_calculator("tiled", drawing))
+
+def effective_iterations(counts, maxIterations):
+    counts = np.asarray(counts, dtype=np.int64)
+    return int(np.where(counts == 0, maxIterations, counts).sum())
+
+# pixels counts calls for the benchmarks that do not render (unit "calls")
+def result(name, seconds, pixels, iterations=None, unit="px", **fields):
+    entry = dict(fields)
+    entry["unit"] = unit
+    entry["seconds"] = seconds
+    entry["pixels"] = pixels
+    entry["pixelsPerSecond"] = pixels / seconds if seconds else 0.0
+    if iterations is not None:
+        entry["iterationsPerSecond"] = iterations / seconds if seconds else 0.0
+    return name, entry
+
+def bench_engines(args, tileRenderer):
+    for viewport in args.viewports:
+        fractal, complexRect, shallow = VIEWPORTS[viewport]
+        for engine in args.engines:
+            if not shallow and engine != "perturbation":
+                continue # float64 engines only produce blocks at this depth
+            if engine in ("perturbation", "scalar") and find_fractal(fractal)[0].name != MANDLEBROT:
+                continue # perturbation and the scalar loop are z^2 + c only
+            for size in args.sizes:
+                for maxIterations in args.iterations:
+                    drawing = make_drawing(viewport, size, maxIterations)
+                    best = None
+                    for repeat in range(args.repeat):
+                        seconds, counts = run_engine(engine, drawing, tileRenderer)
+                        if best is None or seconds < best[0]:
+                            best = (seconds, counts)
+                    seconds, counts = best
+                    yield result("%s/%s/%d/%d" % (viewport, engine, size, maxIterations), seconds, int(counts.size),
+                                 effective_iterations(counts, maxIterations), viewport=viewport, engine=engine,
+                                 size=size, maxIterations=maxIterations)
+
+def bench_color_mapping(args):
+    colorManager = ColorManager()
+    size = max(args.sizes)
+    maxIterations = max(args.iterations)
+    counts = np.random.default_rng(0).integers(0, maxIterations, (size, size)).astype(np.uint16)
+    best = min(timed(lambda: colorManager.colorize(counts, maxIterations)) for repeat in range(args.repeat))
+    yield result("color/colorize/%d" % size, best, counts.size, engine="colorize", size=size)
+    smoothCounts = counts.astype(np.float32) + np.random.default_rng(1).random(counts.shape, dtype=np.float32)
+    for coloring in (COLORING_SMOOTH, COLORING_EQUALIZED):
+        colorManager.setColoring(coloring)
+        best = min(timed(lambda: colorManager.colorize(smoothCounts, maxIterations)) for repeat in range(args.repeat))
+        yield result("color/%s/%d" % (coloring.lower(), size), best, counts.size, engine=coloring.lower(), size=size)
+    colorManager.setColoring(COLORING_BANDS)
+    calculator = MandlebrotCalculator(make_drawing("mandlebrot-initial", size, maxIterations))
+    sample = counts.ravel()[:SCALAR_SAMPLE_PIXELS].tolist()
+    best = min(timed(lambda: [calculator.lookup_color(count, maxIterations, colorManager) for count in sample])
+               for repeat in range(args.repeat))
+    yield result("color/lookup_color/%d" % size, best, len(sample), engine="lookup_color", size=size)
+
+def bench_zoom_math(args):
+    zoom = PixelRectangle(200, 250, 120, 90)
+    for viewport in ("mandlebrot-initial", "deep-zoom"):
+        complexRect = VIEWPORTS[viewport][1]
+        count = 1000
+        best = min(timed(lambda: [zoom_rectangle(complexRect, zoom, 600, 600) for n in range(count)])
+                   for repeat in range(args.repeat))
+        yield result("zoom/%s" % viewport, best, count, viewport=viewport, engine="zoom_rectangle", unit="calls")
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+# Keys whose pixels/s dropped by more than threshold against the baseline
+def find_regressions(results, baseline, threshold):
+    regressions = []
+    for name, entry in results.items():
+        previous = baseline.get(name)
+        if previous is None or not previous["pixelsPerSecond"]:
+            continue
+        ratio = entry["pixelsPerSecond"] / previous["pixelsPerSecond"]
+        if ratio < 1 - threshold:
+            regressions.append((name, ratio))
+    return regressions
+
+def parse_list(convert):
+    return lambda text: [convert(item) for item in text.split(",")]
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the fractal engines, color mapping and zoom maths")
+    parser.add_argument("--viewports", type=parse_list(str), default=list(VIEWPORTS))
+    parser.add_argument("--engines", type=parse_list(str), default=ENGINES)
+    parser.add_argument("--sizes", type=parse_list(int), default=SIZES)
+    parser.add_argument("--iterations", type=parse_list(int), default=ITERATIONS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=0, help="worker processes for the tiled engine (0: one per CPU core)")
+    parser.add_argument("--quick", action="store_true", help="smallest size and iteration count only")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file from an earlier --save to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    return parser
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    if args.quick:
+        args.sizes = [min(args.sizes)]
+        args.iterations = [min(args.iterations)]
+    for viewport in args.viewports:
+        if viewport not in VIEWPORTS:
+            print("Unknown viewport: " + viewport)
+            return 2
+    tileRenderer = TileRenderer(args.workers or None)
+    results = {}
+    try:
+        if "tiled" in args.engines:
+            warm_up(tileRenderer)
+        for benchmarks in (bench_engines(args, tileRenderer), bench_color_mapping(args), bench_zoom_math(args)):
+            for name, entry in benchmarks:
+                results[name] = entry
+                rate = "%14.0f %s/s" % (entry["pixelsPerSecond"], entry["unit"])
+                if "iterationsPerSecond" in entry:
+                    rate += " %16.0f it/s" % entry["iterationsPerSecond"]
+                print("%-48s %9.4f s %s" % (name, entry["seconds"], rate))
+    finally:
+        tileRenderer.close()
+    report = {
+        "machine": {"python": platform.python_version(), "numpy": np.__version__,
+                    "platform": platform.platform(), "cpus": os.cpu_count()},
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w") as output:
+            json.dump(report, output, indent=1, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as baselineFile:
+            baseline = json.load(baselineFile)["results"]
+        regressions = find_regressions(results, baseline, args.threshold)
+        for name, ratio in regressions:
+            print("REGRESSION %s: %.0f%% of baseline pixels/s" % (name, 100 * ratio))
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
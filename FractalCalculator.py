@@ -1,16 +1,201 @@
 # Abstract Class FractalCalculator
 # Concrete subclasses for Mandlebrot and Julia Sets
+# plot_image uses a whole-frame numpy engine, plot_image_scalar is the original per-pixel reference
+# No Qt imports: images are only touched through QImage methods, headless renders never call them
 
-from PyQt5 import QtCore, QtGui
+import copy
+import time
+from fractions import Fraction
+import numpy as np
+
+SUBDIVIDE_MIN_SIZE = 6 # rectangles this small are computed pixel by pixel
+SUBDIVIDE_MAX_FILL = 64 # larger rectangles are always split, a uniform escape band can enclose detail
+PERIODICITY_TOLERANCE = 1e-12
+ANTIALIAS_THRESHOLD = 2 # neighbouring counts further apart than this make both pixels edge pixels
+SYMMETRY_CONJUGATE = "conjugate" # c and its complex conjugate have the same count (mirror image about the real axis)
+SYMMETRY_POINT = "point" # z and -z have the same count (point symmetry about the origin)
+SMOOTH_MIN_COUNT = 1e-3 # smallest continuous count of an escaped point, 0 is kept for "never escaped"
+
+# Raised inside a render when its cancel callback returns True
+class RenderCancelled(Exception):
+    pass
+
+# Closed-form test for the Mandlebrot main cardioid and period-2 bulb, works on scalars and arrays
+def in_cardioid_or_bulb(cR, cI):
+    x = cR - 0.25
+    q = x * x + cI * cI
+    cardioid = q * (q + x) < 0.25 * cI * cI
+    bulb = (cR + 1) * (cR + 1) + cI * cI < 0.0625
+    return cardioid | bulb
+
+# Fractional part of the continuous (normalized) iteration count n + 1 - log_d(log|z| / log 2)
+# of points that escaped at iteration n with |z|^2 = distSquared, for a formula of degree d
+# 1 when |z|^2 lands on the bailout 4, lower the further the last step overshoots it: below 0 for
+# large |c| and high degrees, without a lower bound
+def smooth_offset(distSquared, degree=2):
+    return 1 - np.log2(np.log(distSquared) / (2 * np.log(2))) / np.log2(degree)
+
+# Continuous count of points that escaped at iteration n, kept above the interior count 0
+def smooth_count(n, distSquared, degree=2):
+    return np.maximum(n + smooth_offset(distSquared, degree), SMOOTH_MIN_COUNT)
+
+# Escape-time loop over a flat array of points, only the still-active points are iterated
+# cR, cI may be arrays (one c per point) or scalars (one c for all points)
+# Returns the same counts as the scalar test_point: first i with |z|^2 >= 4, or 0 if it never escapes
+# With a tolerance, points whose orbit comes back within tolerance of a saved z (re-saved at
+# iterations 2, 4, 8, ...) are cycling and stop early with 0, counted in shortcuts["periodicity"]
+# With smooth, counts are float32 continuous counts (see smooth_count) instead of integers
+# step(zR, zI, cR, cI) -> (zR, zI) replaces z^2 + c by another formula of the given degree (see Formulas)
+# interior: optional boolean array the size of zR, set for the points the periodicity check proved bounded
+def escape_time(zR, zI, cR, cI, maxIterations, cancel=None, tolerance=None, shortcuts=None, smooth=False,
+                step=None, degree=2, interior=None):
+    counts = np.zeros(zR.shape, dtype=np.float32 if smooth else np.uint32)
+    active = np.arange(zR.size)
+    perPoint = np.ndim(cR) > 0
+    savedR = zR
+    savedI = zI
+    nextSave = 2
+    for i in range(1, maxIterations):
+        if cancel is not None and cancel():
+            raise RenderCancelled()
+        if step is None:
+            zROld = zR
+            zR = zR * zR - zI * zI + cR
+            zI = 2 * zROld * zI + cI
+        else:
+            zR, zI = step(zR, zI, cR, cI)
+        distSquared = zR * zR + zI * zI
+        done = distSquared >= 4
+        if smooth:
+            counts[active[done]] = smooth_count(i, distSquared[done], degree)
+        else:
+            counts[active[done]] = i
+        if tolerance is not None:
+            cycled = (np.abs(zR - savedR) < tolerance) & (np.abs(zI - savedI) < tolerance) & ~done
+            numCycled = np.count_nonzero(cycled)
+            if numCycled:
+                shortcuts["periodicity"] += int(numCycled)
+                if interior is not None:
+                    interior[active[cycled]] = True
+                done |= cycled
+            if i == nextSave:
+                savedR = zR
+                savedI = zI
+                nextSave *= 2
+        if done.any():
+            keep = ~done
+            active = active[keep]
+            if active.size == 0:
+                break
+            zR = zR[keep]
+            zI = zI[keep]
+            if tolerance is not None:
+                savedR = savedR[keep]
+                savedI = savedI[keep]
+            if perPoint:
+                cR = cR[keep]
+                cI = cI[keep]
+    return counts
+
+# Pixel position of an axis when it falls on a pixel center or halfway between two pixels, else None
+def grid_axis(position, size):
+    if (2 * position).denominator == 1 and 0 <= position <= size:
+        return float(position)
+    return None
+
+# For each value the index of the value that is exactly its negation, -1 where there is none
+def mirror_index(values):
+    order = np.argsort(values)
+    sortedValues = values[order]
+    position = np.minimum(np.searchsorted(sortedValues, -values), values.size - 1)
+    return np.where(sortedValues[position] == -values, order[position], -1)
+
+# (start, length) of each run of True in a 1-D mask
+def mask_runs(mask):
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return list(zip(edges[::2].tolist(), (edges[1::2] - edges[::2]).tolist()))
+
+# Fill in the mirrored pixels of a symmetry_plan
+def apply_mirror(counts, mirror):
+    rows, sourceRows, cols, sourceCols = mirror
+    counts[np.ix_(rows, cols)] = counts[np.ix_(sourceRows, sourceCols)]
+
+# Copy RGB rows straight into a Format_RGB888 QImage buffer (rows are padded to bytesPerLine)
+def write_rgb(image, rgb):
+    height, width = rgb.shape[0], rgb.shape[1]
+    bits = image.bits()
+    bits.setsize(image.byteCount())
+    buffer = np.frombuffer(bits, dtype=np.uint8).reshape(image.height(), image.bytesPerLine())
+    buffer[:height, :width * 3] = rgb.reshape(height, width * 3)
+
+# Pixels whose count differs from a 4-neighbour by more than threshold, a bounded pixel (0) counts as maxIterations
+def edge_pixels(iterations, maxIterations, threshold):
+    counts = np.where(iterations == 0, maxIterations, iterations).astype(np.int64)
+    edges = np.zeros(counts.shape, dtype=bool)
+    horizontal = np.abs(np.diff(counts, axis=1)) > threshold
+    edges[:, 1:] |= horizontal
+    edges[:, :-1] |= horizontal
+    vertical = np.abs(np.diff(counts, axis=0)) > threshold
+    edges[1:, :] |= vertical
+    edges[:-1, :] |= vertical
+    return edges
+
+# Replace the supersampled pixels of an (h, w, 3) RGB array with the average color of their samples
+# histogram: the frame's counts, so equalized coloring maps the samples like the frame
+def blend_samples(rgb, samples, colorManager, maxIterations, cmName=None, histogram=None):
+    index, counts = samples
+    if index.size == 0:
+        return
+    perPixel = counts.shape[1] * counts.shape[2]
+    sampleRgb = colorManager.colorize(counts, maxIterations, cmName, histogram).astype(np.uint32)
+    rgb.reshape(-1, 3)[index] = (sampleRgb.sum(axis=(1, 2)) + perPixel // 2) // perPixel
 
 class FractalCalculator():
+    symmetryKind = None # SYMMETRY_CONJUGATE, SYMMETRY_POINT or None
+    flipImaginary = False # the imaginary axis points down the image instead of up
+
     def __init__(self,newDrawing):
         self.drawing = newDrawing
+        self.cancel = None # optional callable, polled during a render
+        self.subdivide = False # Mariani-Silver rectangle subdivision
+        self.cardioidCheck = True # Mandlebrot only
+        self.periodicityCheck = True
+        self.antialias = 1 # sub-pixel grid per side for edge pixels, 1 is off
+        self.antialiasThreshold = ANTIALIAS_THRESHOLD
+        self.refinedPixels = 0
+        self.symmetry = True # copy pixels that are exact mirror images of computed pixels
+        self.gridKey = None # (fractalRect, width, height) that gridAxes belongs to
+        self.gridAxes = None
+        # Pixels short-circuited by each interior shortcut, or copied from their mirror image
+        self.shortcuts = {"cardioid": 0, "periodicity": 0, "symmetry": 0}
+        self.stats = None # RenderStats while profiling, phase timings are skipped when None
+
+    # A calculator with the same options for another drawing (tiles, previews, worker processes)
+    def with_drawing(self, drawing):
+        calculator = copy.copy(self)
+        calculator.drawing = drawing
+        calculator.shortcuts = dict.fromkeys(self.shortcuts, 0)
+        return calculator
+
+    # Hook run once before a drawing is split into tiles, for work every tile would repeat
+    def prepare(self):
+        pass
+
+    def add_shortcuts(self, shortcuts):
+        for name in shortcuts:
+            self.shortcuts[name] += shortcuts[name]
+
+    # Drawings with smooth set get continuous counts, see escape_time
+    def count_dtype(self):
+        return np.float32 if self.drawing.smooth else np.uint32
+
+    def tolerance(self):
+        if self.periodicityCheck:
+            return PERIODICITY_TOLERANCE
+        return None
 
     def calc_color(self,x,y,colorManager):
-        delta  = (self.drawing.fractalRect.rMax - self.drawing.fractalRect.rMin) / self.drawing.width;
-        zR = self.drawing.fractalRect.rMin + ( x ) * delta;
-        zI = self.drawing.fractalRect.iMin + (( self.drawing.height - y )) * delta;
+        zR, zI = self.complex_grid(x, y)
         numIterations = self.test_point( zR, zI, self.drawing.maxIterations);
         color = self.lookup_color( numIterations, self.drawing.maxIterations, colorManager )
         return color
@@ -26,18 +211,290 @@ class FractalCalculator():
         return color
 
     def plot_image(self, colorManager):
+        start = time.perf_counter()
+        iterations = self.compute_iterations()
+        if self.stats is not None:
+            self.stats.add_phase("iterate", start)
+        self.show_iterations(iterations, colorManager)
+
+    def plot_image_scalar(self, colorManager):
         for x in range(self.drawing.width):
             for y in range(self.drawing.height):
                 color = self.calc_color(x,y,colorManager)
-                self.drawing.image.setPixel(x, y, QtGui.qRgb(color[0], color[1], color[2]))
+                # Same value as QtGui.qRgb
+                self.drawing.image.setPixel(x, y, 0xff000000 | (color[0] << 16) | (color[1] << 8) | color[2])
+
+    # Pixel -> complex mapping, works on scalars and arrays of pixel coordinates
+    # Coordinates are measured from an axis that lies on the pixel grid (see grid_axes),
+    # so that mirrored pixels get exactly opposite values
+    def complex_grid(self, xs, ys):
+        delta  = (self.drawing.fractalRect.rMax - self.drawing.fractalRect.rMin) / self.drawing.width
+        axisX, axisY = self.grid_axes()
+        if axisX is None:
+            zR = self.drawing.fractalRect.rMin + xs * delta
+        else:
+            zR = (xs - axisX) * delta
+        if axisY is None and self.flipImaginary:
+            zI = self.drawing.fractalRect.iMin + ys * delta
+        elif axisY is None:
+            zI = self.drawing.fractalRect.iMin + (self.drawing.height - ys) * delta
+        elif self.flipImaginary:
+            zI = (ys - axisY) * delta
+        else:
+            zI = (axisY - ys) * delta
+        return zR, zI
+
+    # Pixel positions (x, y) of the imaginary and the real axis, None for an axis that is outside
+    # the drawing or off the pixel grid; exact, from the decimal bounds of the rectangle
+    def grid_axes(self):
+        key = (self.drawing.fractalRect, self.drawing.width, self.drawing.height)
+        if self.gridKey != key:
+            rMax, rMin, iMax, iMin = [Fraction(bound) for bound in self.drawing.fractalRect.decimal_bounds()]
+            pixelsPerUnit = self.drawing.width / (rMax - rMin)
+            axisY = -iMin * pixelsPerUnit if self.flipImaginary else self.drawing.height + iMin * pixelsPerUnit
+            self.gridAxes = (grid_axis(-rMin * pixelsPerUnit, self.drawing.width),
+                             grid_axis(axisY, self.drawing.height))
+            self.gridKey = key
+        return self.gridAxes
+
+    # Iteration counts for the pixel rectangle (x0,y0,w,h) of the drawing, shape (h, w)
+    def compute_iterations(self, x0=0, y0=0, w=None, h=None):
+        if w is None:
+            w = self.drawing.width - x0
+        if h is None:
+            h = self.drawing.height - y0
+        plan = self.symmetry_plan(x0, y0, w, h)
+        if plan is None:
+            return self.compute_region(x0, y0, w, h)
+        rects, mirror = plan
+        counts = np.empty((h, w), dtype=self.count_dtype())
+        for rx, ry, rw, rh in rects:
+            counts[ry:ry+rh, rx:rx+rw] = self.compute_region(x0 + rx, y0 + ry, rw, rh)
+        apply_mirror(counts, mirror)
+        return counts
+
+    # Splits the pixel rectangle (x0,y0,w,h) by the symmetry of the fractal: returns the rectangles
+    # that have to be computed and the mirror copy for apply_mirror, both relative to (x0, y0),
+    # or None when no pixel has an exact mirror image in the rectangle
+    # Only pixels whose complex values are exact opposites are paired, so the counts are the same as computed ones
+    def symmetry_plan(self, x0, y0, w, h):
+        if not self.symmetry or self.symmetryKind is None or w <= 0 or h <= 0:
+            return None
+        # Off the grid only scattered pixels pair up, too few to be worth splitting the rectangle
+        axisX, axisY = self.grid_axes()
+        if axisY is None or (self.symmetryKind == SYMMETRY_POINT and axisX is None):
+            return None
+        zR, zI = self.complex_grid(np.arange(x0, x0 + w), np.arange(y0, y0 + h))
+        rowSource = mirror_index(zI)
+        rows = np.flatnonzero((zI < 0) & (rowSource >= 0)) # copied from the rows above the real axis
+        if self.symmetryKind == SYMMETRY_POINT:
+            colSource = mirror_index(zR)
+        else:
+            colSource = np.arange(w)
+        cols = np.flatnonzero(colSource >= 0)
+        if rows.size == 0 or cols.size == 0:
+            return None
+        copiedRows = np.zeros(h, dtype=bool)
+        copiedRows[rows] = True
+        copiedCols = np.zeros(w, dtype=bool)
+        copiedCols[cols] = True
+        rects = [(0, ry, w, rh) for ry, rh in mask_runs(~copiedRows)]
+        for ry, rh in mask_runs(copiedRows):
+            rects.extend((rx, ry, rw, rh) for rx, rw in mask_runs(~copiedCols))
+        self.shortcuts["symmetry"] += int(rows.size * cols.size)
+        return rects, (rows, rowSource[rows], cols, colSource[cols])
+
+    # compute_iterations without the symmetry
+    def compute_region(self, x0, y0, w, h):
+        if self.subdivide:
+            return self.compute_subdivided(x0, y0, w, h)
+        xs = np.arange(x0, x0 + w)
+        ys = np.arange(y0, y0 + h)
+        return self.compute_points(xs[np.newaxis, :], ys[:, np.newaxis])
+
+    # Iteration counts after panning the viewport by (dx, dy) whole pixels: the overlap is copied
+    # from the previous drawing's counts, only the newly exposed strips are computed
+    def compute_panned(self, previous, dx, dy):
+        w = self.drawing.width
+        h = self.drawing.height
+        x0, x1 = max(0, -dx), min(w, w - dx)
+        y0, y1 = max(0, -dy), min(h, h - dy)
+        if x0 >= x1 or y0 >= y1:
+            return self.compute_iterations() # no overlap left
+        if previous.dtype.kind != np.dtype(self.count_dtype()).kind:
+            return self.compute_iterations() # the coloring changed between integer and continuous counts
+        counts = np.empty((h, w), dtype=self.count_dtype())
+        counts[y0:y1, x0:x1] = previous[y0+dy:y1+dy, x0+dx:x1+dx]
+        if x0 > 0:
+            counts[:, :x0] = self.compute_iterations(0, 0, x0, h)
+        if x1 < w:
+            counts[:, x1:] = self.compute_iterations(x1, 0, w - x1, h)
+        if y0 > 0:
+            counts[:y0, x0:x1] = self.compute_iterations(x0, 0, x1 - x0, y0)
+        if y1 < h:
+            counts[y1:, x0:x1] = self.compute_iterations(x0, y1, x1 - x0, h - y1)
+        return counts
+
+    # Mariani-Silver: compute the border of a rectangle, fill it if the whole border has one count,
+    # otherwise split it in four (children share the split lines) and repeat
+    # All the rectangles of one level are computed together in a single compute_points call
+    def compute_subdivided(self, x0, y0, w, h):
+        counts = np.zeros((h, w), dtype=self.count_dtype())
+        known = np.zeros((h, w), dtype=bool)
+        rects = [(0, 0, w, h)]
+        while rects:
+            borders = [self.rect_border(rect) for rect in rects]
+            self.compute_unknown(counts, known, x0, y0,
+                np.concatenate([border[0] for border in borders]),
+                np.concatenate([border[1] for border in borders]))
+            children = []
+            smallRects = []
+            for (rx, ry, rw, rh), (bx, by) in zip(rects, borders):
+                border = counts[by, bx]
+                if rw <= 2 or rh <= 2:
+                    continue # no interior
+                if rw <= SUBDIVIDE_MAX_FILL and rh <= SUBDIVIDE_MAX_FILL and (border == border[0]).all():
+                    counts[ry+1:ry+rh-1, rx+1:rx+rw-1] = border[0]
+                    known[ry+1:ry+rh-1, rx+1:rx+rw-1] = True
+                elif rw <= SUBDIVIDE_MIN_SIZE or rh <= SUBDIVIDE_MIN_SIZE:
+                    smallRects.append((rx, ry, rw, rh))
+                else:
+                    mx = rx + rw // 2
+                    my = ry + rh // 2
+                    for cx, cw in ((rx, mx - rx + 1), (mx, rx + rw - mx)):
+                        for cy, ch in ((ry, my - ry + 1), (my, ry + rh - my)):
+                            children.append((cx, cy, cw, ch))
+            if smallRects:
+                interiors = [np.mgrid[ry+1:ry+rh-1, rx+1:rx+rw-1] for rx, ry, rw, rh in smallRects]
+                self.compute_unknown(counts, known, x0, y0,
+                    np.concatenate([interior[1].ravel() for interior in interiors]),
+                    np.concatenate([interior[0].ravel() for interior in interiors]))
+            rects = children
+        return counts
+
+    # Border pixel coordinates (xs, ys) of a rectangle in tile coordinates
+    def rect_border(self, rect):
+        rx, ry, rw, rh = rect
+        xs = np.arange(rx, rx + rw)
+        ys = np.arange(ry + 1, ry + rh - 1)
+        borderX = np.concatenate([xs, xs, np.full(ys.size, rx), np.full(ys.size, rx + rw - 1)])
+        borderY = np.concatenate([np.full(rw, ry), np.full(rw, ry + rh - 1), ys, ys])
+        return borderX, borderY
+
+    # Compute the listed tile pixels that are not known yet
+    def compute_unknown(self, counts, known, x0, y0, xs, ys):
+        index = np.unique(ys * counts.shape[1] + xs)
+        index = index[~known.ravel()[index]]
+        if index.size == 0:
+            return
+        ys, xs = np.divmod(index, counts.shape[1])
+        counts[ys, xs] = self.compute_points(xs + x0, ys + y0)
+        known[ys, xs] = True
+
+    # Number of pixels where the subdivision render differs from a brute-force render
+    # Uniform borders can enclose filaments thinner than a pixel, so a few mismatches are possible
+    def subdivision_mismatches(self):
+        subdivided = self.with_drawing(self.drawing)
+        subdivided.subdivide = True
+        bruteForce = self.with_drawing(self.drawing)
+        bruteForce.subdivide = False
+        return int((subdivided.compute_iterations() != bruteForce.compute_iterations()).sum())
+
+    # Iteration counts for arbitrary (broadcastable) arrays of pixel coordinates
+    # interior: optional flat boolean array, set for the points a shortcut proved bounded
+    def compute_points(self, xs, ys, interior=None):
+        zR, zI = self.complex_grid(xs, ys)
+        zR, zI = np.broadcast_arrays(zR, zI)
+        counts = self.iterate(zR.ravel(), zI.ravel(), self.drawing.maxIterations, interior)
+        return counts.reshape(zR.shape)
+
+    # Vectorized lookup_color: maps an array of iteration counts to an (h, w, 3) uint8 RGB array
+    def color_iterations(self, iterations, colorManager):
+        return colorManager.colorize(iterations, self.drawing.maxIterations)
+
+    # Keep the counts on the drawing (for recoloring) and paint them into its image
+    # With antialias on, the edge pixels are supersampled and their samples kept on the drawing
+    # pan: (previous drawing's samples, dx, dy) when iterations come from compute_panned
+    def show_iterations(self, iterations, colorManager, pan=None):
+        self.drawing.set_iterations(iterations)
+        start = time.perf_counter()
+        rgb = self.color_iterations(iterations, colorManager)
+        if self.stats is not None:
+            start = self.stats.add_phase("color", start)
+        if self.antialias > 1:
+            if pan is not None and pan[0] is not None:
+                self.drawing.samples = self.sample_panned(iterations, *pan)
+            else:
+                self.drawing.samples = self.sample_edges(iterations)
+            blend_samples(rgb, self.drawing.samples, colorManager, self.drawing.maxIterations, histogram=iterations)
+            if self.stats is not None:
+                start = self.stats.add_phase("antialias", start)
+        self.write_image(rgb)
+        if self.stats is not None:
+            self.stats.add_phase("write", start)
+
+    # Counts on an antialias x antialias sub-pixel grid for the edge pixels of iterations,
+    # whose top left pixel is (x0, y0): returns (flat pixel indices, (n, grid, grid) counts)
+    def sample_edges(self, iterations, x0=0, y0=0):
+        index = np.flatnonzero(edge_pixels(iterations, self.drawing.maxIterations, self.antialiasThreshold))
+        return index, self.sample_pixels(index, iterations.shape[1], x0, y0)
+
+    # Edge samples after a pan by (dx, dy) whole pixels, see compute_panned: the previous samples are
+    # shifted along, only edge pixels without one (in or next to the new strips) are supersampled
+    def sample_panned(self, iterations, previous, dx, dy):
+        index, counts = previous
+        if counts.shape[1] != self.antialias or counts.dtype.kind != np.dtype(self.count_dtype()).kind:
+            return self.sample_edges(iterations)
+        h, w = iterations.shape
+        edges = edge_pixels(iterations, self.drawing.maxIterations, self.antialiasThreshold).ravel()
+        ys, xs = np.divmod(index, w)
+        xs = xs - dx
+        ys = ys - dy
+        inView = (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+        index = ys[inView] * w + xs[inView]
+        counts = counts[inView]
+        stillEdge = edges[index]
+        index = index[stillEdge]
+        counts = counts[stillEdge]
+        edges[index] = False
+        missing = np.flatnonzero(edges)
+        index = np.concatenate((index, missing))
+        counts = np.concatenate((counts, self.sample_pixels(missing, w)))
+        order = np.argsort(index)
+        return index[order], counts[order]
+
+    # Counts on an antialias x antialias sub-pixel grid for the flat pixel indices index of a
+    # width pixels wide region whose top left pixel is (x0, y0)
+    def sample_pixels(self, index, width, x0=0, y0=0):
+        grid = self.antialias
+        ys, xs = np.divmod(index, width)
+        offsets = (np.arange(grid) + 0.5) / grid - 0.5
+        counts = self.compute_points((xs + x0)[:, np.newaxis, np.newaxis] + offsets[np.newaxis, np.newaxis, :],
+                                     (ys + y0)[:, np.newaxis, np.newaxis] + offsets[np.newaxis, :, np.newaxis])
+        self.refinedPixels += int(index.size)
+        return counts
+
+    def write_image(self, rgb):
+        write_rgb(self.drawing.image, rgb)
 
     def test_point(self, cR, cI, max_iter):
         pass
 
+    def iterate(self, zR, zI, max_iter, interior=None):
+        pass
+
 class MandlebrotCalculator(FractalCalculator):
+    symmetryKind = SYMMETRY_CONJUGATE
+
     def test_point(self, cR, cI, maxIterations ):
+        if self.cardioidCheck and in_cardioid_or_bulb(cR, cI):
+            self.shortcuts["cardioid"] += 1
+            return 0
         zR = cR
         zI = cI
+        savedR = zR
+        savedI = zI
+        nextSave = 2
         for i in range(1, maxIterations ):
             zROld = zR
             zR = zR * zR - zI * zI + cR
@@ -45,10 +502,40 @@ class MandlebrotCalculator(FractalCalculator):
             distSquared = zR * zR + zI * zI
             if distSquared >= 4:
                 return i
+            if self.periodicityCheck:
+                if abs(zR - savedR) < PERIODICITY_TOLERANCE and abs(zI - savedI) < PERIODICITY_TOLERANCE:
+                    self.shortcuts["periodicity"] += 1
+                    return 0
+                if i == nextSave:
+                    savedR = zR
+                    savedI = zI
+                    nextSave *= 2
         return 0
 
+    def iterate(self, cR, cI, maxIterations, interior=None):
+        if not self.cardioidCheck:
+            return escape_time(cR.copy(), cI.copy(), cR, cI, maxIterations, self.cancel,
+                               self.tolerance(), self.shortcuts, self.drawing.smooth, interior=interior)
+        counts = np.zeros(cR.shape, dtype=self.count_dtype())
+        outside = ~in_cardioid_or_bulb(cR, cI)
+        self.shortcuts["cardioid"] += int(cR.size - np.count_nonzero(outside))
+        cR = cR[outside]
+        cI = cI[outside]
+        outsideInterior = None if interior is None else np.zeros(cR.size, dtype=bool)
+        counts[outside] = escape_time(cR.copy(), cI.copy(), cR, cI, maxIterations, self.cancel,
+                                      self.tolerance(), self.shortcuts, self.drawing.smooth, interior=outsideInterior)
+        if interior is not None:
+            interior[~outside] = True
+            interior[outside] = outsideInterior
+        return counts
+
 class JuliaCalculator(FractalCalculator):
+    symmetryKind = SYMMETRY_POINT
+
     def test_point(self, zR, zI, maxIterations ):
+        savedR = zR
+        savedI = zI
+        nextSave = 2
         for i in range(1, maxIterations ):
             zROld = zR
             zR = zR * zR - zI * zI + self.drawing.juliaPoint.real
@@ -56,6 +543,18 @@ class JuliaCalculator(FractalCalculator):
             distSquared = zR * zR + zI * zI
             if distSquared >= 4:
                 return i
+            if self.periodicityCheck:
+                if abs(zR - savedR) < PERIODICITY_TOLERANCE and abs(zI - savedI) < PERIODICITY_TOLERANCE:
+                    self.shortcuts["periodicity"] += 1
+                    return 0
+                if i == nextSave:
+                    savedR = zR
+                    savedI = zI
+                    nextSave *= 2
         return 0
-        
 
+    def iterate(self, zR, zI, maxIterations, interior=None):
+        jp = self.drawing.juliaPoint
+        return escape_time(zR, zI, jp.real, jp.imaginary, maxIterations, self.cancel,
+                           self.tolerance(), self.shortcuts, self.drawing.smooth, interior=interior)
+        
@@ -1,18 +1,39 @@
 ### FRACTAL APPLICATION - MAIN
+import os
 import sys
-import math
+import copy
+import struct
+import time
 from PyQt5 import QtCore, QtGui, QtWidgets
-from FractalCalculator import MandlebrotCalculator
-from FractalCalculator import JuliaCalculator
+from FractalCalculator import RenderCancelled
+from FractalCalculator import blend_samples, write_rgb
+from FractalRenderer import at_zoom_limit, guess_max_iterations, limit_zoom, make_calculator, pan_rectangle
+from FractalRenderer import probe_max_iterations, zoom_rectangle
+from Formulas import find_fractal, flipped_view, fractal_name, fractal_names, initial_rectangle, new_drawing, same_fractal
+from TileRenderer import TileRenderer
+from RemoteRenderer import RemoteTileRenderer
+from RenderCache import RenderCache
+from RenderStats import RenderStats, append_log, format_stats
+from Session import SESSION_EXTENSION, load_session, map_iterations, save_session
 from ColorManager import *
 
 WIDTH = 600
 HEIGHT = 600
-INITIAL_ITERATIONS = 20
-MANDLEBROT = "Mandlebrot"
-JULIA = "Julia"
-INITIAL_MANDLEBROT_RECTANGLE = ComplexRectangle( 1.5, -2.5, 2.0, -2.0 )
-INITIAL_JULIA_RECTANGLE = ComplexRectangle( 2.0, -2.0, 2.0, -2.0 )
+RENDER_WORKERS = None # None means one worker process per CPU core
+RENDER_SERVERS = [] # "host:port" of render servers (RenderServer.py), tiles go to them instead of local workers
+PREVIEW_SCALES = [8] # coarse passes shown before the full image; 1/8 costs 1/64 of it, 1/4 and 1/2 would delay the tiles by a third
+PAN_PIXELS = 40 # pixels moved per arrow key press
+CACHE_BYTES = 256 * 1024 * 1024 # memory budget for the iteration buffers of past renders
+CACHE_SPILL_DIR = None # directory for evicted buffers, None means evicted renders are recomputed
+AUTO_ITERATIONS_SECONDS = 0.5 # time budget of the probe render in auto iterations mode
+JULIA_PREVIEW_SIZE = 120 # live Julia thumbnail while choosing the Julia point
+JULIA_PREVIEW_ITERATIONS = 200
+JULIA_PREVIEW_MIN_ITERATIONS = 25
+JULIA_PREVIEW_MS = 30 # at most one preview per interval, mouse moves in between only update the point
+JULIA_PREVIEW_SECONDS = 0.04 # frame budget, slower previews are dropped and retried with fewer iterations
+JULIA_PREVIEW_FAST = 0.25 # share of the budget under which a preview doubles the iterations back for the next one
+SESSION_FILE = None # opened at start and saved on close, None means sessions are only saved on request
+RENDER_LOG_FILE = None # profiled renders are appended here as JSON lines, None means no log
 
 # FractalCanvas is A necessary subclass of QWidget
 # this implements paintEvent for drawing, also handles the mouse events
@@ -20,18 +41,53 @@ class FractalCanvas(QtWidgets.QWidget):
     def __init__(self, parent):
         super().__init__(parent)
         self.setMouseTracking(True)
+        self.setFocusPolicy(QtCore.Qt.StrongFocus) # arrow keys pan
         self.image = None
+        self.zoomRect = None # drawn over the image, never into it
         self.fractalApp = parent
 
     def paintEvent(self, event):
+        if self.image is None:
+            return # nothing rendered yet
         painter = QtGui.QPainter(self)
-        painter.drawImage(0, 0, self.image)
+        # Only the invalidated part of the image is repainted
+        dirty = event.rect()
+        painter.drawImage(dirty, self.image, dirty)
+        zoom = self.zoomRect
+        if zoom:
+            pen = QtGui.QPen(QtCore.Qt.white)
+            pen.setWidth(2)
+            painter.setPen(pen)
+            painter.drawRect(zoom.xUL, zoom.yUL, zoom.width, zoom.height)
+            pen.setColor(QtCore.Qt.black)
+            painter.setPen(pen)
+            painter.drawRect(zoom.xUL+1, zoom.yUL+1, zoom.width-2, zoom.height-2)
 
-    def set_image(self, image):
+    def set_image(self, image, zoomRect=None):
         self.image = image
+        self.zoomRect = zoomRect
         # Redraw the canvas
         self.update()
 
+    # Moving the zoom rectangle only repaints the outlines of the old and the new rectangle
+    def set_zoom(self, zoomRect):
+        dirty = self.zoom_region(self.zoomRect) + self.zoom_region(zoomRect)
+        self.zoomRect = zoomRect
+        self.update(dirty)
+
+    # Pixels covered by the outline of a zoom rectangle (both pens, with a margin for antialiasing)
+    def zoom_region(self, zoom):
+        if not zoom:
+            return QtGui.QRegion()
+        outline = QtGui.QRegion(zoom.xUL - 2, zoom.yUL - 2, zoom.width + 5, zoom.height + 5)
+        if zoom.width > 6 and zoom.height > 6:
+            outline -= QtGui.QRegion(zoom.xUL + 3, zoom.yUL + 3, zoom.width - 6, zoom.height - 6)
+        return outline
+
+    def keyPressEvent(self, event):
+        if not self.fractalApp.key_pressed_event(event.key()):
+            super().keyPressEvent(event)
+
     def mouseMoveEvent(self, event):
         # Get the mouse position
         x = event.x()
@@ -46,6 +102,132 @@ class FractalCanvas(QtWidgets.QWidget):
         y = event.y()
         self.fractalApp.mouse_down_event(x,y)
 
+# Live Julia thumbnail over the top right corner of the canvas, a click renders the full Julia set
+class JuliaPreview(QtWidgets.QWidget):
+    def __init__(self, parent, fractalApp):
+        super().__init__(parent)
+        self.setFixedSize(JULIA_PREVIEW_SIZE, JULIA_PREVIEW_SIZE)
+        self.setCursor(QtCore.Qt.PointingHandCursor)
+        self.setToolTip("Click to render this Julia set")
+        self.image = None
+        self.fractalApp = fractalApp
+        self.hide()
+
+    def paintEvent(self, event):
+        if self.image is None:
+            return
+        painter = QtGui.QPainter(self)
+        painter.drawImage(0, 0, self.image)
+        painter.setPen(QtCore.Qt.white)
+        painter.drawRect(0, 0, self.width() - 1, self.height() - 1)
+
+    def set_image(self, image):
+        self.image = image
+        self.update()
+
+    def mousePressEvent(self, event):
+        self.fractalApp.on_julia_preview_click()
+
+# RenderThread computes a drawing off the GUI thread
+# Emits coarse-to-fine previews, then the finished drawing; cancel() stops it at the next check
+class RenderThread(QtCore.QThread):
+    passReady = QtCore.pyqtSignal(object)
+    renderDone = QtCore.pyqtSignal(object)
+
+    def __init__(self, calculator, colorManager, tileRenderer, pan=None, probeSeconds=None, known=None):
+        super().__init__()
+        self.calculator = calculator
+        self.colorManager = colorManager
+        self.tileRenderer = tileRenderer
+        self.pan = pan # (previous iterations, previous samples, dx, dy) to reuse, see compute_panned
+        self.probeSeconds = probeSeconds # budget of a probe that picks maxIterations first, None keeps it
+        self.known = known # counts already known (cached), only their antialias samples are computed
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def is_cancelled(self):
+        return self.cancelled
+
+    def run(self):
+        drawing = self.calculator.drawing
+        stats = self.calculator.stats
+        try:
+            if self.probeSeconds is not None:
+                drawing.maxIterations = probe_max_iterations(drawing, self.probeSeconds, cancel=self.is_cancelled)
+            if self.known is not None or self.pan is not None:
+                self.calculator.cancel = self.is_cancelled
+                start = time.perf_counter()
+                panned = None
+                if self.known is not None:
+                    iterations = self.known
+                else:
+                    previous, samples, dx, dy = self.pan
+                    iterations = self.calculator.compute_panned(previous, dx, dy)
+                    panned = (samples, dx, dy)
+                if stats is not None:
+                    stats.add_phase("iterate", start)
+                self.calculator.show_iterations(iterations, self.colorManager, panned)
+                self.finish_stats()
+                self.renderDone.emit(drawing)
+                return
+            start = time.perf_counter()
+            for scale in PREVIEW_SCALES:
+                preview = copy.copy(drawing)
+                preview.width = max(1, drawing.width // scale)
+                preview.height = max(1, drawing.height // scale)
+                preview.image = QtGui.QImage(preview.width, preview.height, QtGui.QImage.Format_RGB888)
+                previewCalculator = self.calculator.with_drawing(preview)
+                previewCalculator.cancel = self.is_cancelled
+                previewCalculator.stats = None
+                previewCalculator.antialias = 1
+                previewCalculator.plot_image(self.colorManager)
+                self.passReady.emit(preview.image.scaled(drawing.width, drawing.height))
+            if stats is not None:
+                stats.add_phase("preview", start)
+            self.calculator.cancel = self.is_cancelled
+            self.tileRenderer.plot_image(self.calculator, self.colorManager)
+        except RenderCancelled:
+            return
+        if not self.cancelled:
+            self.finish_stats()
+            self.renderDone.emit(drawing)
+
+    # Summarize in this thread, the histogram is not free for large drawings
+    def finish_stats(self):
+        if self.calculator.stats is not None:
+            drawing = self.calculator.drawing
+            drawing.stats = self.calculator.stats.finish(drawing, drawing.iterations, self.calculator.shortcuts)
+
+# JuliaPreviewThread renders the Julia thumbnail off the GUI thread
+# cancel() drops it for a newer point, past its frame budget it stops by itself
+class JuliaPreviewThread(QtCore.QThread):
+    previewDone = QtCore.pyqtSignal(object)
+
+    def __init__(self, calculator, colorManager, key, seconds):
+        super().__init__()
+        self.calculator = calculator
+        self.colorManager = colorManager
+        self.key = key # (point, colormap, formula) being rendered
+        self.seconds = seconds
+        self.cancelled = False
+        self.elapsed = None # render time, stays None when cancelled or over budget
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        start = time.perf_counter()
+        deadline = start + self.seconds
+        self.calculator.cancel = lambda: self.cancelled or time.perf_counter() > deadline
+        try:
+            self.calculator.plot_image(self.colorManager)
+            self.elapsed = time.perf_counter() - start
+        except RenderCancelled:
+            pass
+        self.previewDone.emit(self.calculator.drawing.image)
+
 #########################################################################
 class FractalApp(QtWidgets.QMainWindow):
     def __init__(self):
@@ -59,6 +241,13 @@ class FractalApp(QtWidgets.QMainWindow):
         self.previousStack = Stack()
         self.juliaPoint = ComplexPoint(0,0)
         self.previousIterations = INITIAL_ITERATIONS
+        if RENDER_SERVERS:
+            self.tileRenderer = RemoteTileRenderer(RENDER_SERVERS)
+        else:
+            self.tileRenderer = TileRenderer(RENDER_WORKERS)
+        self.renderThread = None
+        self.renderAddsHistory = True
+        self.renderCache = RenderCache(CACHE_BYTES, CACHE_SPILL_DIR)
 
         # Layout H1 :
         fractal_button = QtWidgets.QPushButton("Make New Fractal")
@@ -67,9 +256,20 @@ class FractalApp(QtWidgets.QMainWindow):
         self.cm_list.addItems(self.colorManager.listOfColorMaps())
         self.cm_list.setCurrentText(self.colorManager.initialColorMap())
         self.cm_list.currentTextChanged.connect(self.on_color_map_change)
+        colors_label = QtWidgets.QLabel("Colors:")
+        self.colors_spin = QtWidgets.QSpinBox()
+        self.colors_spin.setRange(2, 4096)
+        self.colors_spin.setValue(self.colorManager.numColors())
+        self.colors_spin.valueChanged.connect(self.on_num_colors_change)
+        self.coloring_list = QtWidgets.QComboBox()
+        self.coloring_list.addItems(self.colorManager.listOfColorings())
+        self.coloring_list.currentTextChanged.connect(self.on_coloring_change)
         H1_layout = QtWidgets.QHBoxLayout()
         H1_layout.addWidget(fractal_button) 
         H1_layout.addWidget(self.cm_list)
+        H1_layout.addWidget(colors_label)
+        H1_layout.addWidget(self.colors_spin)
+        H1_layout.addWidget(self.coloring_list)
 
         # Layout H2 :
         H2_layout = QtWidgets.QHBoxLayout()
@@ -82,6 +282,12 @@ class FractalApp(QtWidgets.QMainWindow):
         H2_layout.addWidget(self.next_button)
         H2_layout.addWidget(self.previous_button)
         H2_layout.addWidget(self.delete_button)      
+        save_button = QtWidgets.QPushButton("Save Session")
+        save_button.clicked.connect(self.on_save_session_click)
+        open_button = QtWidgets.QPushButton("Open Session")
+        open_button.clicked.connect(self.on_open_session_click)
+        H2_layout.addWidget(save_button)
+        H2_layout.addWidget(open_button)
         self.next_button.setEnabled(False)
         self.previous_button.setEnabled(False)
         self.delete_button.setEnabled(False)
@@ -91,13 +297,25 @@ class FractalApp(QtWidgets.QMainWindow):
         iterations_label = QtWidgets.QLabel("Max Iterations:")
         self.iterations_txt = QtWidgets.QLineEdit()
         self.iterations_txt.setText(str(INITIAL_ITERATIONS))
+        self.auto_check = QtWidgets.QCheckBox("Auto")
+        self.subdivide_check = QtWidgets.QCheckBox("Subdivide")
+        self.profile_check = QtWidgets.QCheckBox("Profile")
+        antialias_label = QtWidgets.QLabel("Antialias:")
+        self.antialias_spin = QtWidgets.QSpinBox()
+        self.antialias_spin.setRange(1, 8) # sub-pixel grid per side for edge pixels
+        self.antialias_spin.setSpecialValueText("Off")
         H3_layout.addWidget(iterations_label)
         H3_layout.addWidget(self.iterations_txt)
+        H3_layout.addWidget(self.auto_check)
+        H3_layout.addWidget(self.subdivide_check)
+        H3_layout.addWidget(self.profile_check)
+        H3_layout.addWidget(antialias_label)
+        H3_layout.addWidget(self.antialias_spin)
 
         # Layour H4
         H4_layout = QtWidgets.QHBoxLayout()
         self.mj_list = QtWidgets.QComboBox()
-        self.mj_list.addItems([MANDLEBROT,JULIA])
+        self.mj_list.addItems(fractal_names())
         self.mj_list.setCurrentText(MANDLEBROT)
         self.mj_list.currentTextChanged.connect(self.on_mj_change)
         jp_label = QtWidgets.QLabel("Julia Point:")
@@ -108,6 +326,15 @@ class FractalApp(QtWidgets.QMainWindow):
 
         # Class FractalCanvas is required because Qlabel doesn't handle mouse events
         self.canvas = FractalCanvas(self)
+        self.juliaPreview = JuliaPreview(self.canvas, self)
+        self.juliaPreview.move(WIDTH - JULIA_PREVIEW_SIZE - 10, 10)
+        self.juliaPreviewIterations = JULIA_PREVIEW_ITERATIONS
+        self.juliaPreviewPoint = None # point of the thumbnail on show
+        self.juliaPreviewThread = None
+        self.juliaPreviewTimer = QtCore.QTimer(self)
+        self.juliaPreviewTimer.setSingleShot(True)
+        self.juliaPreviewTimer.setInterval(JULIA_PREVIEW_MS)
+        self.juliaPreviewTimer.timeout.connect(self.render_julia_preview)
 
         # Vertical layout - add H* sub-layouts and the canvas
         V_layout = QtWidgets.QVBoxLayout()
@@ -124,9 +351,12 @@ class FractalApp(QtWidgets.QMainWindow):
         # The following is a hack to size the main window
         # A better way would be for the layout manager to autosize this
         # but I couldn't get it to work (canvas stubbornly drawn to zero size)
-        self.setGeometry(0, 0, WIDTH+20, HEIGHT+135)
+        self.setGeometry(0, 0, WIDTH+20, HEIGHT+160) # includes the status bar
 
-        # Draw the Hello World Fractal
+        # Draw the Hello World Fractal, or carry on with the saved session
+        if SESSION_FILE is not None and os.path.exists(SESSION_FILE) and self.open_session(SESSION_FILE):
+            self.show()
+            return
         image = QtGui.QImage(WIDTH, HEIGHT, QtGui.QImage.Format_RGB888)
         newDrawing = Drawing(image, INITIAL_MANDLEBROT_RECTANGLE, WIDTH, HEIGHT, INITIAL_ITERATIONS, INITIAL_COLORMAP)
         self.do_make_new_fractal(newDrawing)
@@ -138,8 +368,16 @@ class FractalApp(QtWidgets.QMainWindow):
         delta = (currentRect.rMax - currentRect.rMin) / WIDTH
         jr = currentRect.rMin + (pos.x * delta)
         ji = currentRect.iMin + ((HEIGHT - pos.y)*delta)
+        if flipped_view(self.currentDrawing):
+            ji = currentRect.iMin + pos.y * delta
         return ComplexPoint(jr,ji)
 
+    def cancel_render(self):
+        if self.renderThread is not None:
+            self.renderThread.cancel()
+            self.renderThread.wait()
+            self.renderThread = None
+
     def determine_max_iterations(self,complexRect):
         # If the user did not change the number of iterations, make a guess...
         maxIterations = self.currentDrawing.maxIterations
@@ -149,18 +387,21 @@ class FractalApp(QtWidgets.QMainWindow):
             print("Max Iterations is not an integer")
             maxIterations = self.currentDrawing.maxIterations
         if self.previousIterations == maxIterations:
-            initialWidth = INITIAL_MANDLEBROT_RECTANGLE.rMax - INITIAL_MANDLEBROT_RECTANGLE.rMin
-            newWidth = complexRect.rMax - complexRect.rMin
-            zoomFactor = initialWidth / newWidth
-            if zoomFactor < 1:
-                zoomFactor = 1
-            logZoom = math.log(zoomFactor)
-            magnitude = (logZoom/2.3)-2.0 # just a guess
-            if magnitude < 1.0:
-                magnitude = 1.0
-            maxIterations = INITIAL_ITERATIONS * (magnitude * logZoom + 1.0)
+            maxIterations = guess_max_iterations(complexRect)
         return maxIterations
 
+    # In auto mode an untouched iteration count comes from a probe render instead of the guess,
+    # the render thread runs the probe first: the probe budget in seconds, or None
+    def determine_auto_iterations(self):
+        if not self.auto_check.isChecked():
+            return None
+        try:
+            if int(self.iterations_txt.text()) != self.previousIterations:
+                return None # the user typed a count
+        except ValueError:
+            pass
+        return AUTO_ITERATIONS_SECONDS
+
     def display_julia_point(self,jp):
         # To Do: make this precision a variable, as with javascript version
         # use 5 decimal points for now
@@ -170,99 +411,109 @@ class FractalApp(QtWidgets.QMainWindow):
         self.jp_txt.setText(jpAsString )
 
     def do_delete_fractal(self):
+        self.cancel_render()
         if self.nextStack.is_empty() and self.previousStack.is_empty():
             return
         if not self.nextStack.is_empty():
             self.currentDrawing = self.nextStack.pop()
         else:    
             self.currentDrawing = self.previousStack.pop()     
+        self.restore_drawing(self.currentDrawing)
         self.update_control_panel()
 
-    def do_make_new_fractal(self,newDrawing):
-        if isinstance(newDrawing, JuliaDrawing):
-            self.calculator = JuliaCalculator(newDrawing) 
-        else:
-            self.calculator = MandlebrotCalculator(newDrawing)
-
-        self.calculator.plot_image(self.colorManager)
+    # known: the drawing's counts when they are already known, see RenderThread
+    def do_make_new_fractal(self,newDrawing,addToHistory=True,pan=None,probeSeconds=None,known=None):
+        self.cancel_render()
+        self.renderAddsHistory = addToHistory
+        if addToHistory:
+            # Restores keep the counts and antialiasing they were made with
+            newDrawing.smooth = self.colorManager.wantsSmooth()
+            newDrawing.antialias = self.antialias_spin.value()
+        # A viewport rendered before needs no escape-time iterations (restores already checked)
+        # The cache holds plain counts only, antialiased drawings compute their edge samples from them
+        # A probed iteration count, part of the cache key, is only known once the render thread has run
+        if addToHistory and probeSeconds is None:
+            known = self.renderCache.get(newDrawing.cache_key())
+            if known is not None and newDrawing.antialias == 1:
+                self.paint_iterations(newDrawing, known)
+                self.statusBar().showMessage("Painted from the render cache")
+                self.finish_new_fractal(newDrawing)
+                return
+        self.calculator = make_calculator(newDrawing)
+        self.calculator.subdivide = self.subdivide_check.isChecked()
+        self.calculator.antialias = newDrawing.antialias
+        if self.profile_check.isChecked():
+            self.calculator.stats = RenderStats()
+        if self.firstPaint:
+            self.currentDrawing = newDrawing
+
+        # Render in the background, the canvas shows previews until finish_new_fractal
+        self.renderThread = RenderThread(self.calculator, self.colorManager, self.tileRenderer, pan, probeSeconds, known)
+        self.renderThread.passReady.connect(self.on_render_pass)
+        self.renderThread.renderDone.connect(self.on_render_done)
+        self.renderThread.start()
+
+    def finish_new_fractal(self,newDrawing):
+        self.renderCache.put(newDrawing.cache_key(), newDrawing.iterations)
         self.canvas.set_image(newDrawing.image)
 
-        if self.firstPaint == False:
-            self.previousStack.push(self.currentDrawing)
-            self.previous_button.setEnabled(True)
-        else:
-           self.firstPaint = False 
-        self.currentDrawing = newDrawing;
+        if self.renderAddsHistory:
+            if self.firstPaint == False:
+                self.push_history(self.previousStack)
+                self.previous_button.setEnabled(True)
+            else:
+               self.firstPaint = False 
+            self.currentDrawing = newDrawing;
         self.previousIterations = newDrawing.maxIterations
         self.update_control_panel()
 
     def do_next_fractal(self):
+        self.cancel_render()
         if not self.nextStack.is_empty():
             self.do_next_previous(self.nextStack, self.previousStack)
 
     def do_next_previous(self, fromStack, toStack):
-        toStack.push(self.currentDrawing)
+        self.push_history(toStack)
         newCurrentDrawing = fromStack.pop()
         self.currentDrawing = newCurrentDrawing
+        self.restore_drawing(newCurrentDrawing)
         self.update_control_panel()
 
+    # Shift the viewport by whole pixels on the current pixel grid, reusing the pixels still in view
+    def do_pan(self, dx, dy):
+        if self.renderThread is not None and self.renderThread.pan is not None:
+            # Another pan is still computing: continue from its target, reusing the same source pixels
+            target = self.renderThread.calculator.drawing
+            previous, samples, panX, panY = self.renderThread.pan
+            panX += dx
+            panY += dy
+        else:
+            target = self.currentDrawing
+            previous = target.iterations
+            samples = target.samples
+            panX, panY = dx, dy
+            if previous is None:
+                return # still rendering
+        image = QtGui.QImage(WIDTH, HEIGHT, QtGui.QImage.Format_RGB888)
+        complexRect = self.make_panned_rectangle(target, dx, dy)
+        newDrawing = same_fractal(target, image, complexRect, WIDTH, HEIGHT, target.maxIterations, self.colorManager.currentCM)
+        self.do_make_new_fractal(newDrawing, True, (previous, samples, panX, panY))
+
     def do_previous_fractal(self):
+        self.cancel_render()
         if not self.previousStack.is_empty():
             self.do_next_previous(self.previousStack, self.nextStack)
 
+    # The canvas draws the zoom rectangle as an overlay, the drawing's image is shown as is
     def draw_image_with_zoom(self):
-        image = QtGui.QImage(WIDTH, HEIGHT, QtGui.QImage.Format_RGB888)
-        painter = QtGui.QPainter()
-        painter.begin(image)
-        painter.drawImage(QtCore.QPoint(0, 0), self.currentDrawing.image)
-        zoom = self.currentDrawing.zoomRect
-        if zoom:
-            pen = QtGui.QPen(QtCore.Qt.white)
-            pen.setWidth(2)
-            painter.setPen(pen)
-            painter.drawRect(zoom.xUL, zoom.yUL, zoom.width, zoom.height)
-            pen.setColor(QtCore.Qt.black)
-            painter.setPen(pen)
-            painter.drawRect(zoom.xUL+1, zoom.yUL+1, zoom.width-2, zoom.height-2)   
-        painter.end()
-        self.canvas.set_image(image)
+        self.canvas.set_image(self.currentDrawing.image, self.currentDrawing.zoomRect)
 
     def make_complex_rectangle(self,drawing):
-        # The maths for zooming...
-        # We need a subset of drawing.fractalRect according to the drawing.zoomRect in pixels
-        # And that needs to be scaled to match the image size
-        iMin = drawing.fractalRect.iMin
-        iMax = drawing.fractalRect.iMax
-        rMin = drawing.fractalRect.rMin
-        rMax = drawing.fractalRect.rMax
-
-        if drawing.zoomRect == None:
-            return ComplexRectangle(rMax,rMin,iMax,iMin)
-
-        # delta is complex distance per pixel, should be same for V and H dimensions
-        delta = (rMax - rMin) / WIDTH
-        newRMin = rMin+(drawing.zoomRect.xUL * delta)
-        newIMin = iMin+(HEIGHT - drawing.zoomRect.yUL- drawing.zoomRect.height)* delta
-        newRMax = rMin+((drawing.zoomRect.xUL + drawing.zoomRect.width)* delta)
-        newIMax = iMin+(HEIGHT - drawing.zoomRect.yUL)* delta
-        complexWidth = newRMax - newRMin
-        complexHeight = newIMax - newIMin
-        imageWHRatio = WIDTH / HEIGHT
-        complexWHRatio = complexWidth / complexHeight
-        
-        if imageWHRatio < complexWHRatio :
-            #Expand vertically
-            newHeight = complexWidth / imageWHRatio
-            heightDifference = newHeight - complexHeight 
-            newIMin = newIMin - heightDifference / 2
-            newIMax = newIMax + heightDifference / 2
-        else:
-            # Expand horizontally
-            newWidth = complexHeight * imageWHRatio
-            widthDifference = newWidth - complexWidth
-            newRMin = newRMin - widthDifference / 2
-            newRMax = newRMax + widthDifference / 2
-        return ComplexRectangle(newRMax,newRMin,newIMax,newIMin)
+        # The maths for zooming live in FractalRenderer.zoom_rectangle (Decimal, Qt-free)
+        return zoom_rectangle(drawing.fractalRect, drawing.zoomRect, WIDTH, HEIGHT, flipped_view(drawing))
+
+    def make_panned_rectangle(self, drawing, dx, dy):
+        return pan_rectangle(drawing.fractalRect, dx, dy, WIDTH, flipped_view(drawing))
 
     def make_pixel_rectangle(self, x1, x2, y1, y2):
         x_ul = 0
@@ -283,12 +534,130 @@ class FractalApp(QtWidgets.QMainWindow):
             height = y2 - y1
         return PixelRectangle( x_ul, y_ul, width, height )
 
+    # Repaint the current drawing from its stored iteration counts, no escape-time iterations
+    def recolor_current_drawing(self):
+        drawing = self.currentDrawing
+        if drawing.iterations is None:
+            return # still rendering, the render colors with the new palette when it finishes
+        drawing.cmName = self.colorManager.currentCM
+        rgb = self.colorManager.colorize(drawing.iterations, drawing.maxIterations)
+        if drawing.samples is not None:
+            blend_samples(rgb, drawing.samples, self.colorManager, drawing.maxIterations, histogram=drawing.iterations)
+        write_rgb(drawing.image, rgb)
+        self.draw_image_with_zoom()
+
+    def paint_iterations(self, drawing, iterations):
+        drawing.set_iterations(iterations)
+        write_rgb(drawing.image, self.colorManager.colorize(iterations, drawing.maxIterations, drawing.cmName))
+
+    # History entries keep only their parameters (and cache key), the current drawing is released
+    def push_history(self, stack):
+        stack.push(self.currentDrawing)
+        self.currentDrawing.release()
+
+    # Bring back the pixels of a history entry, recomputing them if the cache evicted them
+    # Antialiased entries get their edge samples back from the render thread
+    def restore_drawing(self, drawing):
+        if drawing.iterations is not None:
+            return
+        drawing.image = QtGui.QImage(drawing.width, drawing.height, QtGui.QImage.Format_RGB888)
+        iterations = self.renderCache.get(drawing.cache_key())
+        if iterations is None and drawing.savedIterations is not None:
+            # Loaded from a session: the buffer is mapped only now that the entry is shown
+            iterations = map_iterations(drawing.savedIterations)
+        if iterations is not None and drawing.antialias == 1:
+            self.paint_iterations(drawing, iterations)
+            return
+        self.do_make_new_fractal(drawing, False, known=iterations)
+
+    # Returns False when the file cannot be read, the open session is kept then
+    def open_session(self, path):
+        try:
+            current, previous, following = load_session(path)
+        except (OSError, ValueError, KeyError, TypeError, struct.error) as error:
+            print("Cannot open session " + path + ": " + str(error))
+            return False
+        self.cancel_render()
+        self.previousStack = Stack()
+        self.nextStack = Stack()
+        for drawing in previous:
+            self.previousStack.push(drawing)
+        for drawing in following:
+            self.nextStack.push(drawing)
+        self.firstPaint = False
+        self.currentDrawing = current
+        self.restore_drawing(current)
+        self.update_control_panel()
+        return True
+
+    def save_session(self, path):
+        try:
+            save_session(path, self.currentDrawing, self.previousStack.items, self.nextStack.items, self.renderCache.peek)
+        except OSError as error:
+            print("Cannot save session " + path + ": " + str(error))
+
+    def show_render_stats(self, drawing):
+        if drawing.stats is None:
+            if at_zoom_limit(drawing):
+                self.statusBar().showMessage("Zoom limit: %s has no deep zoom engine" % fractal_name(drawing))
+            elif drawing.samples is not None:
+                self.statusBar().showMessage("%d edge pixels refined" % drawing.samples[0].size)
+            else:
+                self.statusBar().clearMessage()
+            return
+        # The cache belongs to the GUI thread, its counters join the summary here rather than in RenderStats.finish
+        drawing.stats["cache"] = self.renderCache.stats()
+        self.statusBar().showMessage(format_stats(drawing.stats))
+        if RENDER_LOG_FILE is not None:
+            append_log(RENDER_LOG_FILE, drawing.stats)
+
+    # Throttled: requests while a preview is pending are merged, it renders the latest point
+    def request_julia_preview(self):
+        if not self.juliaPreviewTimer.isActive():
+            self.juliaPreviewTimer.start()
+
+    # Julia variant of the formula chosen in the menu, rendered on a JuliaPreviewThread
+    # Only one runs at a time: a newer point cancels it and is rendered once it has stopped
+    def render_julia_preview(self):
+        jp = self.juliaPoint
+        formula = find_fractal(self.mj_list.currentText())[0]
+        key = (jp.real, jp.imaginary, self.colorManager.currentCM, formula.name)
+        if self.juliaPreviewThread is not None:
+            if self.juliaPreviewThread.key != key:
+                self.juliaPreviewThread.cancel()
+            return
+        if self.juliaPreviewPoint == key:
+            return
+        image = QtGui.QImage(JULIA_PREVIEW_SIZE, JULIA_PREVIEW_SIZE, QtGui.QImage.Format_RGB888)
+        drawing = new_drawing(formula.juliaName, image, formula.juliaRect, JULIA_PREVIEW_SIZE, JULIA_PREVIEW_SIZE,
+                              self.juliaPreviewIterations, self.colorManager.currentCM, jp)
+        self.juliaPreviewThread = JuliaPreviewThread(make_calculator(drawing), self.colorManager, key, JULIA_PREVIEW_SECONDS)
+        self.juliaPreviewThread.previewDone.connect(self.on_julia_preview_done)
+        self.juliaPreviewThread.start()
+
+    def on_julia_preview_done(self, image):
+        thread = self.juliaPreviewThread
+        if self.sender() is not thread:
+            return
+        thread.wait()
+        self.juliaPreviewThread = None
+        retry = thread.cancelled # a newer point is waiting
+        if thread.elapsed is not None:
+            # Fast enough that twice the iterations still fit the budget: points in easier regions get the detail back
+            if thread.elapsed < JULIA_PREVIEW_FAST * JULIA_PREVIEW_SECONDS:
+                self.juliaPreviewIterations = min(JULIA_PREVIEW_ITERATIONS, self.juliaPreviewIterations * 2)
+            self.juliaPreviewPoint = thread.key
+            self.juliaPreview.set_image(image)
+        elif not thread.cancelled and self.juliaPreviewIterations > JULIA_PREVIEW_MIN_ITERATIONS:
+            # Over budget: the same point again with fewer iterations
+            self.juliaPreviewIterations = max(JULIA_PREVIEW_MIN_ITERATIONS, self.juliaPreviewIterations // 2)
+            retry = True
+        if retry:
+            self.render_julia_preview()
+
     def update_control_panel(self):
         self.cm_list.setCurrentText(self.currentDrawing.cmName)
-        if isinstance(self.currentDrawing, JuliaDrawing):
-            self.mj_list.setCurrentText(JULIA)
-        else:
-            self.mj_list.setCurrentText(MANDLEBROT)
+        self.mj_list.setCurrentText(fractal_name(self.currentDrawing))
         if self.previousStack.is_empty():
             self.previous_button.setEnabled(False)
         else:
@@ -307,7 +676,29 @@ class FractalApp(QtWidgets.QMainWindow):
 
     ### ACTION LISTENERS
 
+    def closeEvent(self, event):
+        self.cancel_render()
+        if self.juliaPreviewThread is not None:
+            self.juliaPreviewThread.cancel()
+            self.juliaPreviewThread.wait()
+        if SESSION_FILE is not None:
+            self.save_session(SESSION_FILE)
+        self.tileRenderer.close()
+        super().closeEvent(event)
+
+    # Returns True when the key was handled
+    def key_pressed_event(self,key):
+        pans = {QtCore.Qt.Key_Left: (-PAN_PIXELS, 0), QtCore.Qt.Key_Right: (PAN_PIXELS, 0),
+                QtCore.Qt.Key_Up: (0, -PAN_PIXELS), QtCore.Qt.Key_Down: (0, PAN_PIXELS)}
+        if key not in pans:
+            return False
+        self.do_pan(*pans[key])
+        return True
+
     def mouse_down_event(self,x,y):
+        if not self.juliaSelectMode and self.renderThread is not None:
+            if self.renderThread.calculator.drawing is not self.currentDrawing:
+                self.cancel_render() # starting a new zoom
         self.mousePosition= PixelPoint(x,y)
         self.mouseDown = True
         self.zoomClick = self.mousePosition
@@ -317,11 +708,12 @@ class FractalApp(QtWidgets.QMainWindow):
         if self.juliaSelectMode:
             self.juliaPoint = self.calculate_julia_point(self.mousePosition)
             self.display_julia_point(self.juliaPoint)
+            self.request_julia_preview()
         else:
             if self.mouseDown:
                 zoom = self.make_pixel_rectangle(self.zoomClick.x,x,self.zoomClick.y,y)
                 self.currentDrawing.set_zoom(zoom)
-                self.draw_image_with_zoom()
+                self.canvas.set_zoom(zoom)
 
     def mouse_up_event(self):
         self.mouseDown = False
@@ -329,38 +721,67 @@ class FractalApp(QtWidgets.QMainWindow):
             self.juliaPoint = self.calculate_julia_point(self.mousePosition)
             self.display_julia_point(self.juliaPoint)
             self.juliaSelectMode = False
+            self.request_julia_preview() # stays on show, a click on it renders the picked point
 
     def on_color_map_change(self,cm):
         self.colorManager.setCM(cm)
+        self.recolor_current_drawing()
 
     def on_delete_button_click(self):
         self.do_delete_fractal()
 
     def on_fractal_button_click(self):
+        self.juliaPreview.hide()
         # Gather new drawing parameters
         image = QtGui.QImage(WIDTH, HEIGHT, QtGui.QImage.Format_RGB888)
-        complexRect = INITIAL_MANDLEBROT_RECTANGLE
         mj = self.mj_list.currentText()
-        if mj == JULIA:
-            if isinstance(self.currentDrawing, JuliaDrawing) == False:
-                complexRect = INITIAL_JULIA_RECTANGLE
-            else:
-                complexRect = self.make_complex_rectangle(self.currentDrawing)
-            # Double the iterations for julia sets 
-            maxIterations = 2 *int(self.determine_max_iterations(complexRect))
-            newDrawing = JuliaDrawing(image, complexRect, WIDTH, HEIGHT, maxIterations, self.colorManager.currentCM,self.juliaPoint)
+        # Zoom into the current view, or start from the initial view of another fractal
+        if fractal_name(self.currentDrawing) == mj:
+            complexRect = self.make_complex_rectangle(self.currentDrawing)
         else:
-            if isinstance(self.currentDrawing, JuliaDrawing) == False:
-                complexRect = self.make_complex_rectangle(self.currentDrawing)
-            maxIterations = int(self.determine_max_iterations(complexRect))
-            newDrawing = Drawing(image, complexRect, WIDTH, HEIGHT, maxIterations, self.colorManager.currentCM)
-        self.do_make_new_fractal(newDrawing)
+            complexRect = initial_rectangle(mj)
+        complexRect = limit_zoom(mj, complexRect, WIDTH, HEIGHT)
+        maxIterations = int(self.determine_max_iterations(complexRect))
+        if find_fractal(mj)[1]:
+            # Double the iterations for julia sets 
+            maxIterations *= 2
+        newDrawing = new_drawing(mj, image, complexRect, WIDTH, HEIGHT, maxIterations, self.colorManager.currentCM, self.juliaPoint)
+        self.do_make_new_fractal(newDrawing, probeSeconds=self.determine_auto_iterations())
 
     def on_mj_change(self,mj):
-        if mj == JULIA:
+        if find_fractal(mj)[1]:
             self.juliaSelectMode = True
+            self.juliaPreviewIterations = JULIA_PREVIEW_ITERATIONS
+            self.juliaPreview.show()
+            self.request_julia_preview()
         else:
             self.juliaSelectMode = False
+            self.juliaPreview.hide()
+
+    # Takes effect at once on the current drawing; smooth colorings get continuous counts from the next render
+    def on_coloring_change(self,coloring):
+        self.colorManager.setColoring(coloring)
+        self.recolor_current_drawing()
+
+    def on_num_colors_change(self,numColors):
+        self.colorManager.setNumColors(numColors)
+        self.recolor_current_drawing()
+
+    def on_julia_preview_click(self):
+        self.juliaSelectMode = False
+        self.on_fractal_button_click()
+
+    def on_open_session_click(self):
+        path, selected = QtWidgets.QFileDialog.getOpenFileName(self, "Open Session", "", "Fractal sessions (*" + SESSION_EXTENSION + ")")
+        if path:
+            self.open_session(path)
+
+    def on_save_session_click(self):
+        path, selected = QtWidgets.QFileDialog.getSaveFileName(self, "Save Session", "", "Fractal sessions (*" + SESSION_EXTENSION + ")")
+        if path:
+            if not path.endswith(SESSION_EXTENSION):
+                path += SESSION_EXTENSION
+            self.save_session(path)
 
     def on_next_button_click(self):
         self.do_next_fractal()
@@ -368,6 +789,18 @@ class FractalApp(QtWidgets.QMainWindow):
     def on_previous_button_click(self):
         self.do_previous_fractal()
 
+    def on_render_done(self,newDrawing):
+        if self.sender() is not self.renderThread:
+            return # a stale signal from a cancelled render
+        self.renderThread.wait()
+        self.renderThread = None
+        self.show_render_stats(newDrawing)
+        self.finish_new_fractal(newDrawing)
+
+    def on_render_pass(self,image):
+        if self.sender() is self.renderThread:
+            self.canvas.set_image(image)
+
 ### THE PROGRAM: ###
 if __name__ == "__main__":
     app = QtWidgets.QApplication(sys.argv)
@@ -0,0 +1,316 @@
+### FRACTAL RENDERER - HEADLESS
+# Renders without Qt: a Drawing with no image, iteration counts computed band by band,
+# colored rows streamed straight to a PNG or PPM file, so the full RGB frame is never in memory
+#   python FractalRenderer.py out.png --center=-0.743643887,0.131825904 --width 1e-6 --size 2000x2000
+# (pairs starting with a minus sign need the --option=value form)
+import argparse
+import copy
+import decimal
+import math
+import os
+import struct
+import sys
+import time
+import zlib
+from decimal import Decimal
+import numpy as np
+from ColorManager import *
+from FractalCalculator import RenderCancelled, blend_samples
+from DeepZoom import DEEP_ZOOM_DELTA, DeepMandlebrotCalculator, DeepJuliaCalculator, needs_deep_zoom
+from Formulas import FORMULAS, find_fractal, fractal_names, initial_rectangle, new_drawing
+from TileRenderer import TileRenderer
+from RemoteRenderer import RemoteTileRenderer
+
+BAND_ROWS = 64
+PROBE_WIDTH = 64 # pixels across the low-resolution probe of probe_max_iterations
+PROBE_SECONDS = 0.5
+PROBE_MIN_ITERATIONS = 64
+PROBE_MAX_ITERATIONS = 1 << 20
+PROBE_RESOLVED = 0.001 # share of probe pixels escaping in the last doubling below which the boundary is resolved
+PROBE_HEADROOM = 1.25 # full resolution pixels sit closer to the boundary than the probe's
+ZOOM_LIMIT_DELTA = 2 * Decimal(DEEP_ZOOM_DELTA) # smallest pixel size of formulas without a deep zoom engine
+
+def guess_max_iterations(complexRect):
+    initialWidth = INITIAL_MANDLEBROT_RECTANGLE.rMax - INITIAL_MANDLEBROT_RECTANGLE.rMin
+    rMax, rMin, iMax, iMin = complexRect.decimal_bounds()
+    newWidth = float(rMax - rMin)
+    zoomFactor = initialWidth / newWidth
+    if zoomFactor < 1:
+        zoomFactor = 1
+    logZoom = math.log(zoomFactor)
+    magnitude = (logZoom/2.3)-2.0 # just a guess
+    if magnitude < 1.0:
+        magnitude = 1.0
+    return INITIAL_ITERATIONS * (magnitude * logZoom + 1.0)
+
+# Copy of a drawing at a lower resolution, same complex rectangle
+def make_probe(drawing, probeWidth=PROBE_WIDTH):
+    probe = copy.copy(drawing)
+    probe.image = None
+    probe.iterations = None
+    probe.width = min(probeWidth, drawing.width)
+    probe.height = max(1, round(drawing.height * probe.width / drawing.width))
+    return probe
+
+# Smallest maxIterations that resolves the boundary of a drawing, from a low-resolution probe
+# The limit doubles while doubling still lets a noticeable share of the probe escape, and only the
+# points still bounded are iterated again; the probe stops early once budget seconds are spent
+# cancel: optional callable, when it returns True the probe raises RenderCancelled
+def probe_max_iterations(drawing, budget=PROBE_SECONDS, probeWidth=PROBE_WIDTH, cancel=None):
+    deadline = time.perf_counter() + budget
+    probe = make_probe(drawing, probeWidth)
+    ys, xs = np.mgrid[0:probe.height, 0:probe.width]
+    xs = xs.ravel()
+    ys = ys.ravel()
+    counts = np.zeros(xs.size, dtype=np.float32 if drawing.smooth else np.uint32)
+    pending = np.arange(xs.size)
+    limit = PROBE_MIN_ITERATIONS
+    while True:
+        probe.maxIterations = limit
+        calculator = make_calculator(probe)
+        overtime = limit > PROBE_MIN_ITERATIONS
+        calculator.cancel = lambda: (cancel is not None and cancel()) or (overtime and time.perf_counter() > deadline)
+        interior = np.zeros(pending.size, dtype=bool)
+        try:
+            pendingCounts = calculator.compute_points(xs[pending], ys[pending], interior)
+        except RenderCancelled:
+            if cancel is not None and cancel():
+                raise
+            break
+        escaped = pendingCounts != 0
+        counts[pending[escaped]] = pendingCounts[escaped]
+        # Points the cardioid or periodicity checks proved interior never escape at a higher limit either
+        pending = pending[~escaped & ~interior]
+        if pending.size == 0:
+            break
+        # Nothing escaping yet is an unresolved (flat) view, not a resolved one
+        if counts.any() and limit > PROBE_MIN_ITERATIONS and np.count_nonzero(escaped) <= PROBE_RESOLVED * xs.size:
+            break
+        if limit >= PROBE_MAX_ITERATIONS or time.perf_counter() > deadline:
+            break
+        limit *= 2
+    if not counts.any():
+        return PROBE_MIN_ITERATIONS # nothing escapes, e.g. inside the main cardioid
+    return max(PROBE_MIN_ITERATIONS, int(int(counts.max()) * PROBE_HEADROOM))
+
+# The calculator for a drawing, past float64 precision z^2 + c switches to the perturbation engine
+def make_calculator(drawing):
+    julia = isinstance(drawing, JuliaDrawing)
+    if drawing.formula == MANDLEBROT and needs_deep_zoom(drawing):
+        return DeepJuliaCalculator(drawing) if julia else DeepMandlebrotCalculator(drawing)
+    formula = FORMULAS[drawing.formula]
+    return formula.juliaCalculatorClass(drawing) if julia else formula.calculatorClass(drawing)
+
+# Only z^2 + c has a perturbation engine, other formulas stop zooming where float64 pixels turn blocky:
+# a narrower rectangle is widened around its center to ZOOM_LIMIT_DELTA per pixel
+def limit_zoom(fractalName, complexRect, width, height):
+    rMax, rMin, iMax, iMin = complexRect.decimal_bounds()
+    if find_fractal(fractalName)[0].name == MANDLEBROT or (rMax - rMin) / width >= ZOOM_LIMIT_DELTA:
+        return complexRect
+    return make_rectangle((rMax + rMin) / 2, (iMax + iMin) / 2, ZOOM_LIMIT_DELTA * width, width, height)
+
+# True for a drawing that limit_zoom stopped (within rounding of the limit)
+def at_zoom_limit(drawing):
+    rMax, rMin, iMax, iMin = drawing.fractalRect.decimal_bounds()
+    return drawing.formula != MANDLEBROT and (rMax - rMin) / drawing.width < ZOOM_LIMIT_DELTA * Decimal("1.01")
+
+# Rectangle of the given complex width around a center, with the height following the image shape
+def make_rectangle(centerR, centerI, complexWidth, width, height):
+    complexWidth = Decimal(complexWidth)
+    with decimal.localcontext() as context:
+        # Enough digits to keep the pixels of a very narrow window around a large center apart
+        context.prec = max(28, 30 - (complexWidth / width).adjusted())
+        halfWidth = complexWidth / 2
+        halfHeight = halfWidth * height / width
+        centerR = Decimal(centerR)
+        centerI = Decimal(centerI)
+        return ComplexRectangle(centerR + halfWidth, centerR - halfWidth, centerI + halfHeight, centerI - halfHeight)
+
+# The maths for zooming...
+# We need a subset of fractalRect according to zoomRect in pixels
+# And that needs to be scaled to match the image size
+# Done in Decimal so deep zooms keep their precision (see DeepZoom)
+# flipped: the imaginary axis points down the image (see Formulas.flipped_view)
+def zoom_rectangle(fractalRect, zoomRect, width, height, flipped=False):
+    if zoomRect == None:
+        return fractalRect
+
+    with decimal.localcontext() as context:
+        context.prec = fractalRect.precision(width) + 10
+        rMax, rMin, iMax, iMin = fractalRect.decimal_bounds()
+
+        # delta is complex distance per pixel, should be same for V and H dimensions
+        delta = (rMax - rMin) / width
+        newRMin = rMin+(zoomRect.xUL * delta)
+        newIMin = iMin+(height - zoomRect.yUL- zoomRect.height)* delta
+        newRMax = rMin+((zoomRect.xUL + zoomRect.width)* delta)
+        newIMax = iMin+(height - zoomRect.yUL)* delta
+        if flipped:
+            newIMin = iMin + zoomRect.yUL * delta
+            newIMax = iMin + (zoomRect.yUL + zoomRect.height) * delta
+        complexWidth = newRMax - newRMin
+        complexHeight = newIMax - newIMin
+        imageWHRatio = Decimal(width) / height
+        complexWHRatio = complexWidth / complexHeight
+        
+        if imageWHRatio < complexWHRatio :
+            #Expand vertically
+            newHeight = complexWidth / imageWHRatio
+            heightDifference = newHeight - complexHeight 
+            newIMin = newIMin - heightDifference / 2
+            newIMax = newIMax + heightDifference / 2
+        else:
+            # Expand horizontally
+            newWidth = complexHeight * imageWHRatio
+            widthDifference = newWidth - complexWidth
+            newRMin = newRMin - widthDifference / 2
+            newRMax = newRMax + widthDifference / 2
+    return ComplexRectangle(newRMax,newRMin,newIMax,newIMin)
+
+# Moving the view right/down by whole pixels keeps the same delta grid
+def pan_rectangle(fractalRect, dx, dy, width, flipped=False):
+    if flipped:
+        dy = -dy # down the image is up the imaginary axis
+    with decimal.localcontext() as context:
+        context.prec = fractalRect.precision(width) + 10
+        rMax, rMin, iMax, iMin = fractalRect.decimal_bounds()
+        delta = (rMax - rMin) / width
+        return ComplexRectangle(rMax + dx * delta, rMin + dx * delta, iMax - dy * delta, iMin - dy * delta)
+
+# Colored rows of a drawing, band by band from the top: yields (rows, width, 3) uint8 arrays
+# Antialiasing finds edge pixels per band, pixels differing only from a neighbour across a band border stay 1x
+# histogram: counts whose distribution equalized coloring uses for every band
+def render_bands(calculator, colorManager, tileRenderer=None, bandRows=BAND_ROWS, histogram=None):
+    drawing = calculator.drawing
+    for y0 in range(0, drawing.height, bandRows):
+        rows = min(bandRows, drawing.height - y0)
+        if tileRenderer is None:
+            iterations = calculator.compute_iterations(0, y0, drawing.width, rows)
+        else:
+            iterations = tileRenderer.compute_iterations(calculator, 0, y0, drawing.width, rows)
+        rgb = colorManager.colorize(iterations, drawing.maxIterations, drawing.cmName, histogram)
+        if calculator.antialias > 1:
+            blend_samples(rgb, calculator.sample_edges(iterations, 0, y0), colorManager, drawing.maxIterations,
+                          drawing.cmName, iterations if histogram is None else histogram)
+        yield rgb
+
+def write_ppm(path, width, height, bands):
+    with open(path, "wb") as output:
+        output.write(b"P6\n%d %d\n255\n" % (width, height))
+        for band in bands:
+            output.write(band.tobytes())
+
+def write_png_chunk(output, kind, data):
+    output.write(struct.pack(">I", len(data)) + kind + data)
+    output.write(struct.pack(">I", zlib.crc32(kind + data)))
+
+# 8-bit RGB PNG, each band is compressed and written as soon as it arrives
+def write_png(path, width, height, bands):
+    with open(path, "wb") as output:
+        output.write(b"\x89PNG\r\n\x1a\n")
+        write_png_chunk(output, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        compressor = zlib.compressobj(6)
+        for band in bands:
+            rows = np.zeros((band.shape[0], width * 3 + 1), dtype=np.uint8) # filter byte 0 per row
+            rows[:, 1:] = band.reshape(band.shape[0], width * 3)
+            data = compressor.compress(rows.tobytes())
+            if data:
+                write_png_chunk(output, b"IDAT", data)
+        write_png_chunk(output, b"IDAT", compressor.flush())
+        write_png_chunk(output, b"IEND", b"")
+
+WRITERS = {".png": write_png, ".ppm": write_ppm}
+
+def parse_pair(text):
+    first, second = text.split(",")
+    return first.strip(), second.strip()
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Render a fractal to a PNG or PPM file without Qt")
+    parser.add_argument("output", help="output file, .png or .ppm")
+    parser.add_argument("--fractal", choices=fractal_names(), default=MANDLEBROT)
+    parser.add_argument("--julia", type=parse_pair, default=("0", "0"), help="Julia point R,I")
+    parser.add_argument("--center", type=parse_pair, help="viewport center R,I (default: the initial view)")
+    parser.add_argument("--width", help="viewport width in the complex plane")
+    parser.add_argument("--rect", help="viewport as rMax,rMin,iMax,iMin (overrides --center/--width)")
+    parser.add_argument("--size", type=parse_size, default=(600, 600), help="image size WxH")
+    parser.add_argument("--iterations", type=int, help="maxIterations (default: guessed from the zoom)")
+    parser.add_argument("--auto-iterations", type=float, metavar="SECONDS",
+                        help="pick maxIterations from a low-resolution probe, within this time budget")
+    parser.add_argument("--colormap", default=INITIAL_COLORMAP, choices=ColorManager().listOfColorMaps())
+    parser.add_argument("--colors", type=int, default=NUM_COLORS, help="palette size")
+    parser.add_argument("--coloring", default=COLORING_BANDS, choices=ColorManager().listOfColorings())
+    parser.add_argument("--workers", type=int, default=1, help="worker processes (0: one per CPU core)")
+    parser.add_argument("--servers", type=lambda text: text.split(","), help="render servers host:port,... (see RenderServer.py)")
+    parser.add_argument("--subdivide", action="store_true", help="Mariani-Silver subdivision")
+    parser.add_argument("--antialias", type=int, default=1, metavar="N", help="supersample edge pixels on an NxN grid")
+    parser.add_argument("--band-rows", type=int, default=BAND_ROWS, help="rows computed and written at a time")
+    return parser
+
+def make_drawing(args):
+    width, height = args.size
+    initial = initial_rectangle(args.fractal)
+    if args.rect:
+        complexRect = ComplexRectangle(*[Decimal(bound) for bound in args.rect.split(",")])
+    else:
+        rMax, rMin, iMax, iMin = initial.decimal_bounds()
+        center = args.center or ((rMax + rMin) / 2, (iMax + iMin) / 2)
+        complexRect = make_rectangle(center[0], center[1], args.width or (rMax - rMin), width, height)
+    limited = limit_zoom(args.fractal, complexRect, width, height)
+    if limited is not complexRect:
+        print("%s has no deep zoom engine, zoom limited to a pixel size of %.3g" % (args.fractal, ZOOM_LIMIT_DELTA))
+        complexRect = limited
+    maxIterations = args.iterations
+    julia = find_fractal(args.fractal)[1]
+    if maxIterations is None:
+        maxIterations = int(guess_max_iterations(complexRect))
+        if julia:
+            maxIterations *= 2 # Double the iterations for julia sets, as the GUI does
+    juliaPoint = ComplexPoint(float(args.julia[0]), float(args.julia[1]))
+    drawing = new_drawing(args.fractal, None, complexRect, width, height, maxIterations, args.colormap, juliaPoint)
+    if args.iterations is None and args.auto_iterations is not None:
+        drawing.maxIterations = probe_max_iterations(drawing, args.auto_iterations)
+    return drawing
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    extension = os.path.splitext(args.output)[1].lower()
+    if extension not in WRITERS:
+        print("Output must be a .png or .ppm file")
+        return 2
+    drawing = make_drawing(args)
+    colorManager = ColorManager()
+    colorManager.setNumColors(args.colors)
+    colorManager.setColoring(args.coloring)
+    drawing.smooth = colorManager.wantsSmooth()
+    histogram = None
+    if args.coloring == COLORING_EQUALIZED:
+        # The bands are colored as they stream out, so the count distribution comes from a probe
+        histogram = make_calculator(make_probe(drawing, 2 * PROBE_WIDTH)).compute_iterations()
+    calculator = make_calculator(drawing)
+    calculator.subdivide = args.subdivide
+    calculator.antialias = args.antialias
+    tileRenderer = None
+    if args.servers:
+        tileRenderer = RemoteTileRenderer(args.servers)
+    elif args.workers != 1:
+        tileRenderer = TileRenderer(args.workers or None)
+    start = time.perf_counter()
+    try:
+        bands = render_bands(calculator, colorManager, tileRenderer, args.band_rows, histogram)
+        WRITERS[extension](args.output, drawing.width, drawing.height, bands)
+    finally:
+        if tileRenderer is not None:
+            tileRenderer.close()
+    seconds = time.perf_counter() - start
+    print("Wrote %s: %dx%d, %d iterations, %.2f s" % (args.output, drawing.width, drawing.height, drawing.maxIterations, seconds))
+    if calculator.antialias > 1:
+        print("Refined %d edge pixels (%.1f%%)" % (calculator.refinedPixels, 100 * calculator.refinedPixels / (drawing.width * drawing.height)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
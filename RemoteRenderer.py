@@ -0,0 +1,230 @@
+# RemoteRenderer for Fractal Application
+# RemoteTileRenderer is a drop-in TileRenderer that hands the tiles of a drawing to render servers
+# (see RenderServer.py), retries failed tiles elsewhere, duplicates stragglers on idle servers,
+# and computes the tiles locally when no server is left
+# Messages: 8-byte header (JSON length, payload length), JSON, payload. Jobs are plain JSON, never pickles
+# While a tile is computing the server sends {"working": true} every HEARTBEAT_SECONDS, so a slow tile
+# is told apart from a stalled server
+import collections
+import json
+import queue
+import socket
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+from FractalCalculator import RenderCancelled, apply_mirror
+from Session import drawing_entry
+from TileRenderer import POLL_SECONDS, TILE_SIZE, TileRenderer
+
+DEFAULT_PORT = 7878
+TILE_TIMEOUT = 10.0 # seconds without any message (result or heartbeat) before a server is given up for the render
+HEARTBEAT_SECONDS = 1.0
+TILE_RETRIES = 2 # failures of one tile before it is computed locally
+STRAGGLER_SECONDS = 2.0 # idle servers duplicate a tile that has been running this long
+MAX_TILE_PIXELS = 1 << 22 # larger tile jobs are refused
+MAX_HEADER_BYTES = 1 << 16 # messages claiming more are a protocol error, not a reason to buffer gigabytes
+MAX_PAYLOAD_BYTES = 4 * MAX_TILE_PIXELS + (1 << 16) # counts are 4 bytes, zlib adds a little on incompressible data
+
+class ConnectionClosed(Exception):
+    pass
+
+def read_exact(connection, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise ConnectionClosed("connection closed")
+        data += chunk
+    return bytes(data)
+
+def send_message(connection, header, payload=b""):
+    data = json.dumps(header).encode()
+    connection.sendall(struct.pack(">II", len(data), len(payload)) + data + payload)
+
+def read_message(connection):
+    headerLength, payloadLength = struct.unpack(">II", read_exact(connection, 8))
+    if headerLength > MAX_HEADER_BYTES or payloadLength > MAX_PAYLOAD_BYTES:
+        raise ValueError("Message too large: %d + %d bytes" % (headerLength, payloadLength))
+    header = json.loads(read_exact(connection, headerLength))
+    if not isinstance(header, dict):
+        raise ValueError("Malformed message header")
+    return header, read_exact(connection, payloadLength)
+
+def parse_address(text):
+    host, separator, port = text.rpartition(":")
+    if not separator:
+        return text, DEFAULT_PORT
+    return host, int(port)
+
+# Everything a server needs to rebuild a calculator: the drawing parameters and the engine options
+def job_spec(calculator):
+    spec = drawing_entry(calculator.drawing)
+    spec["subdivide"] = calculator.subdivide
+    spec["cardioidCheck"] = calculator.cardioidCheck
+    spec["periodicityCheck"] = calculator.periodicityCheck
+    return spec
+
+# Which tiles are waiting, running or done; shared by the threads talking to the servers
+class TileDispatch():
+    def __init__(self, numTiles, retries, stragglerSeconds):
+        self.pending = collections.deque(range(numTiles))
+        self.running = {} # tile index -> time it was first handed out
+        self.done = set()
+        self.failures = collections.Counter()
+        self.retries = retries
+        self.stragglerSeconds = stragglerSeconds
+        self.results = queue.Queue() # (index, counts or None for "compute locally", shortcuts)
+        self.stopped = False
+        self.lock = threading.Lock()
+
+    # A tile index, or None once nothing is left to hand out
+    def next_tile(self, taken):
+        while True:
+            with self.lock:
+                if self.stopped:
+                    return None
+                if self.pending:
+                    index = self.pending.popleft()
+                    self.running.setdefault(index, time.perf_counter())
+                    return index
+                if not self.running:
+                    return None
+                # Nothing waiting: take over the oldest tile another server is slow with
+                now = time.perf_counter()
+                for index, started in sorted(self.running.items(), key=lambda item: item[1]):
+                    if index not in taken and now - started > self.stragglerSeconds:
+                        return index
+            time.sleep(POLL_SECONDS)
+
+    def finish(self, index, counts, shortcuts):
+        with self.lock:
+            if index in self.done:
+                return # a duplicate came in second
+            self.done.add(index)
+            self.running.pop(index, None)
+            if index in self.pending:
+                self.pending.remove(index)
+        self.results.put((index, counts, shortcuts))
+
+    def fail(self, index):
+        with self.lock:
+            if index in self.done:
+                return
+            self.failures[index] += 1
+            if self.failures[index] > self.retries:
+                self.done.add(index)
+                self.running.pop(index, None)
+                self.results.put((index, None, None))
+            elif index not in self.pending:
+                self.running.pop(index, None)
+                self.pending.appendleft(index)
+
+    # Every tile not finished yet, for the local fallback
+    def take_unfinished(self):
+        with self.lock:
+            unfinished = [index for index in list(self.pending) + list(self.running) if index not in self.done]
+            self.done.update(unfinished)
+            self.pending.clear()
+            self.running.clear()
+        return unfinished
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+
+class RemoteTileRenderer(TileRenderer):
+    def __init__(self, servers, tileSize=TILE_SIZE, timeout=TILE_TIMEOUT, retries=TILE_RETRIES,
+                 stragglerSeconds=STRAGGLER_SECONDS):
+        super().__init__(len(servers), tileSize)
+        self.servers = [parse_address(server) if isinstance(server, str) else server for server in servers]
+        self.timeout = timeout
+        self.retries = retries
+        self.stragglerSeconds = stragglerSeconds
+        self.failedServers = collections.Counter() # lifetime failures per server, for reporting
+
+    def start(self):
+        pass # connections are opened per render by the server threads
+
+    def close(self):
+        pass
+
+    def compute_iterations(self, calculator, x0=0, y0=0, w=None, h=None):
+        drawing = calculator.drawing
+        if w is None:
+            w = drawing.width - x0
+        if h is None:
+            h = drawing.height - y0
+        counts = np.zeros((h, w), dtype=calculator.count_dtype())
+        tiles, mirror = self.plan_tiles(calculator, x0, y0, w, h)
+        job = {"spec": job_spec(calculator)}
+        dispatch = TileDispatch(len(tiles), self.retries, self.stragglerSeconds)
+        threads = [threading.Thread(target=self.serve_tiles, args=(server, job, tiles, (x0, y0), dispatch), daemon=True)
+                   for server in self.servers]
+        for thread in threads:
+            thread.start()
+        remaining = len(tiles)
+        try:
+            while remaining > 0:
+                if calculator.cancel is not None and calculator.cancel():
+                    raise RenderCancelled()
+                try:
+                    index, tileCounts, shortcuts = dispatch.results.get(timeout=POLL_SECONDS)
+                except queue.Empty:
+                    if not any(thread.is_alive() for thread in threads):
+                        # No server left: the rest is computed here
+                        for index in dispatch.take_unfinished():
+                            dispatch.results.put((index, None, None))
+                    continue
+                tx, ty, tw, th = tiles[index]
+                if tileCounts is None:
+                    tileCounts = calculator.compute_iterations(x0 + tx, y0 + ty, tw, th)
+                else:
+                    calculator.add_shortcuts(shortcuts)
+                counts[ty:ty+th, tx:tx+tw] = tileCounts
+                remaining -= 1
+        finally:
+            dispatch.stop()
+        if mirror is not None:
+            apply_mirror(counts, mirror)
+        return counts
+
+    # Runs in one thread per server: a socket or protocol error ends this server's part in the render,
+    # its tile goes back to the others; an error reply only fails that one tile. The timeout bounds
+    # connecting and the silence between messages, never the time a tile takes
+    def serve_tiles(self, server, job, tiles, origin, dispatch):
+        taken = set()
+        try:
+            connection = socket.create_connection(server, timeout=self.timeout)
+        except OSError as error:
+            print("Render server %s:%d unavailable: %s" % (server[0], server[1], error))
+            self.failedServers[server] += 1
+            return
+        with connection:
+            while True:
+                index = dispatch.next_tile(taken)
+                if index is None:
+                    return
+                taken.add(index)
+                tx, ty, tw, th = tiles[index]
+                try:
+                    send_message(connection, dict(job, tile=[origin[0] + tx, origin[1] + ty, tw, th]))
+                    header, payload = read_message(connection)
+                    # Slow tiles are left to the straggler duplication, the server stays in the render
+                    while header.get("working"):
+                        if dispatch.stopped:
+                            return
+                        header, payload = read_message(connection)
+                    if "error" in header:
+                        print("Render server %s:%d refused a tile: %s" % (server[0], server[1], header["error"]))
+                        dispatch.fail(index)
+                        continue
+                    tileCounts = np.frombuffer(zlib.decompress(payload), dtype=np.dtype(header["dtype"]))
+                    tileCounts = tileCounts.reshape(header["shape"])
+                except (OSError, ValueError, ConnectionClosed, zlib.error) as error:
+                    print("Render server %s:%d failed: %s" % (server[0], server[1], error))
+                    self.failedServers[server] += 1
+                    dispatch.fail(index)
+                    return
+                dispatch.finish(index, tileCounts, header["shortcuts"])
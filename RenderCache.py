@@ -0,0 +1,86 @@
+# RenderCache for Fractal Application
+# Iteration buffers of finished renders, keyed by Drawing.cache_key()
+# Least recently used buffers are evicted once the byte budget is exceeded,
+# optionally spilled (compressed) to a directory so they can be reloaded instead of recomputed
+from collections import OrderedDict
+import hashlib
+import os
+import numpy as np
+
+CACHE_BYTES = 256 * 1024 * 1024
+
+class RenderCache():
+    def __init__(self, maxBytes=CACHE_BYTES, spillDir=None):
+        self.maxBytes = maxBytes
+        self.spillDir = spillDir
+        if spillDir is not None:
+            os.makedirs(spillDir, exist_ok=True)
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spills = 0
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if self.spillDir is not None:
+            path = self.spill_path(key)
+            if os.path.exists(path):
+                with np.load(path) as data:
+                    iterations = data["iterations"]
+                self.diskHits += 1
+                self.put(key, iterations)
+                return iterations
+        self.misses += 1
+        return None
+
+    # Like get, without counting a lookup or touching the eviction order
+    def peek(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, iterations):
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key).nbytes
+        if iterations.nbytes > self.maxBytes:
+            return # would evict everything and still not fit
+        self.entries[key] = iterations
+        self.bytes += iterations.nbytes
+        while self.bytes > self.maxBytes:
+            self.evict()
+
+    def evict(self):
+        key, iterations = self.entries.popitem(last=False)
+        self.bytes -= iterations.nbytes
+        self.evictions += 1
+        if self.spillDir is not None:
+            path = self.spill_path(key)
+            if not os.path.exists(path):
+                np.savez_compressed(path, iterations=iterations)
+                self.spills += 1
+
+    def spill_path(self, key):
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.spillDir, name + ".npz")
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.diskHits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "maxBytes": self.maxBytes,
+            "hits": self.hits,
+            "diskHits": self.diskHits,
+            "misses": self.misses,
+            "hitRate": (self.hits + self.diskHits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "spills": self.spills,
+        }
@@ -0,0 +1,104 @@
+# RenderServer for Fractal Application
+# Computes tiles for other machines: accepts tile jobs over TCP and sends back the zlib compressed
+# iteration counts, see RemoteRenderer.py for the client and the message format
+#   python RenderServer.py --port 7878      (one server per CPU core, each on its own port)
+import argparse
+import collections
+import json
+import socketserver
+import sys
+import threading
+import zlib
+from FractalRenderer import make_calculator
+from RemoteRenderer import DEFAULT_PORT, HEARTBEAT_SECONDS, MAX_TILE_PIXELS, ConnectionClosed, read_message, send_message
+from Session import entry_drawing
+
+SERVER_CALCULATORS = 4 # recent drawings a server keeps calculators (and reference orbits) for
+
+class RenderServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, heartbeatSeconds=HEARTBEAT_SECONDS):
+        super().__init__(address, RenderRequestHandler)
+        self.calculators = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.heartbeatSeconds = heartbeatSeconds
+
+    # Tiles of one drawing share a calculator, so deep zooms compute their reference orbit once
+    def calculator_for(self, spec):
+        key = json.dumps(spec, sort_keys=True)
+        with self.lock:
+            calculator = self.calculators.get(key)
+            if calculator is not None:
+                self.calculators.move_to_end(key)
+        if calculator is None:
+            calculator = make_calculator(entry_drawing(spec))
+            calculator.subdivide = spec["subdivide"]
+            calculator.cardioidCheck = spec["cardioidCheck"]
+            calculator.periodicityCheck = spec["periodicityCheck"]
+            calculator.prepare()
+            with self.lock:
+                self.calculators[key] = calculator
+                while len(self.calculators) > SERVER_CALCULATORS:
+                    self.calculators.popitem(last=False)
+        return calculator
+
+    def render_tile(self, job):
+        x0, y0, w, h = [int(value) for value in job["tile"]]
+        if w <= 0 or h <= 0 or w * h > MAX_TILE_PIXELS:
+            raise ValueError("Tile size %dx%d out of range" % (w, h))
+        calculator = self.calculator_for(job["spec"])
+        calculator = calculator.with_drawing(calculator.drawing) # own shortcut counters, shared orbits
+        return calculator.compute_iterations(x0, y0, w, h), calculator.shortcuts
+
+class RenderRequestHandler(socketserver.BaseRequestHandler):
+    # One connection carries any number of jobs, one at a time
+    def handle(self):
+        while True:
+            try:
+                job, payload = read_message(self.request)
+            except (ConnectionClosed, OSError, ValueError):
+                return # closed, or not speaking the protocol
+            done = threading.Event()
+            heartbeat = threading.Thread(target=self.send_heartbeats, args=(done,), daemon=True)
+            heartbeat.start()
+            try:
+                counts, shortcuts = self.server.render_tile(job)
+            except (ValueError, KeyError, TypeError, ArithmeticError) as error:
+                print("Bad tile job: " + str(error))
+                send_message(self.request, {"error": str(error)})
+                continue
+            finally:
+                done.set()
+                heartbeat.join()
+            header = {"dtype": counts.dtype.str, "shape": list(counts.shape), "shortcuts": shortcuts}
+            send_message(self.request, header, zlib.compress(counts.tobytes(), 1))
+
+    # Tells the client the tile is still being computed, until done is set
+    def send_heartbeats(self, done):
+        while not done.wait(self.server.heartbeatSeconds):
+            try:
+                send_message(self.request, {"working": True})
+            except OSError:
+                return
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Serve fractal tiles to RemoteTileRenderer clients")
+    parser.add_argument("--host", default="127.0.0.1", help="interface to listen on, e.g. 0.0.0.0 for all (no authentication)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--heartbeat", type=float, default=HEARTBEAT_SECONDS, help="seconds between heartbeats")
+    return parser
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    with RenderServer((args.host, args.port), args.heartbeat) as server:
+        print("Render server listening on %s:%d" % (args.host, server.server_address[1]), flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
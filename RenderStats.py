@@ -0,0 +1,70 @@
+# RenderStats for Fractal Application
+# Per-render instrumentation: wall time per phase, iteration totals, an escape-count histogram
+# Only collected while profiling is on, calculators skip every hook when their stats are None
+import json
+import time
+import numpy as np
+
+HISTOGRAM_BINS = 32
+
+class RenderStats():
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.summary = None
+
+    # Adds the time since start (a perf_counter value) to a phase, returns the current time
+    def add_phase(self, name, start):
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + now - start
+        return now
+
+    # Summary of a finished render, a plain dict so it can be logged as JSON
+    def finish(self, drawing, iterations, shortcuts=None):
+        wallSeconds = time.perf_counter() - self.started
+        maxIterations = drawing.maxIterations
+        counts = iterations.ravel()
+        pixels = int(counts.size)
+        escaped = counts[counts != 0]
+        interior = pixels - int(escaped.size) # count 0: still bounded at maxIterations
+        histogram, edges = np.histogram(escaped, bins=min(HISTOGRAM_BINS, max(1, maxIterations - 1)),
+                                        range=(1, max(2, maxIterations)))
+        totalIterations = int(escaped.sum(dtype=np.float64)) + interior * maxIterations
+        self.summary = {
+            "time": time.time(),
+            "kind": type(drawing).__name__,
+            "rect": list(drawing.fractalRect.key()),
+            "width": drawing.width,
+            "height": drawing.height,
+            "maxIterations": maxIterations,
+            "wallSeconds": wallSeconds,
+            "phases": dict(self.phases),
+            "pixels": pixels,
+            "totalIterations": totalIterations,
+            "maxIterationsShare": interior / pixels if pixels else 0.0,
+            "pixelsPerSecond": pixels / wallSeconds if wallSeconds else 0.0,
+            "iterationsPerSecond": totalIterations / wallSeconds if wallSeconds else 0.0,
+            "histogram": histogram.tolist(),
+            "histogramEdges": edges.tolist(),
+            "shortcuts": dict(shortcuts or {}),
+            "refinedPixels": int(drawing.samples[0].size) if drawing.samples is not None else 0,
+        }
+        return self.summary
+
+def append_log(path, summary):
+    with open(path, "a") as log:
+        log.write(json.dumps(summary) + "\n")
+
+# One line for a status bar
+def format_stats(summary):
+    phases = ", ".join("%s %.2f" % (name, seconds) for name, seconds in summary["phases"].items())
+    text = "%dx%d, %d iterations: %.2f s (%s), %.2f Mpixels/s, %.1f%% at maxIterations" % (
+        summary["width"], summary["height"], summary["maxIterations"], summary["wallSeconds"], phases,
+        summary["pixelsPerSecond"] / 1e6, 100 * summary["maxIterationsShare"])
+    if summary["refinedPixels"]:
+        text += ", %d edge pixels refined" % summary["refinedPixels"]
+    cache = summary.get("cache")
+    if cache is not None:
+        text += ", cache %d hits, %d misses, %d evictions" % (cache["hits"] + cache["diskHits"], cache["misses"],
+                                                              cache["evictions"])
+    return text
@@ -0,0 +1,144 @@
+# Session for Fractal Application
+# Saves the current drawing and the Previous/Next history to one file and loads it back
+# Layout: MAGIC, header length (8 bytes), JSON header, then the raw iteration buffers,
+# each aligned to BUFFER_ALIGN bytes so they can be memory-mapped in place
+# Loading only reads the header: a drawing's buffer is mapped when the drawing is shown
+import json
+import os
+import struct
+from decimal import Decimal
+import numpy as np
+from ColorManager import *
+from Formulas import FORMULAS
+
+MAGIC = b"FRACTAL-SESSION-1\n"
+BUFFER_ALIGN = 64
+SESSION_EXTENSION = ".fractal"
+
+def drawing_entry(drawing):
+    entry = {
+        "kind": type(drawing).__name__,
+        "formula": drawing.formula,
+        "rect": list(drawing.fractalRect.key()),
+        "width": drawing.width,
+        "height": drawing.height,
+        "maxIterations": drawing.maxIterations,
+        "cmName": drawing.cmName,
+        "smooth": drawing.smooth,
+        "antialias": drawing.antialias,
+        "iterations": None,
+    }
+    if isinstance(drawing, JuliaDrawing):
+        entry["juliaPoint"] = [drawing.juliaPoint.real, drawing.juliaPoint.imaginary]
+    return entry
+
+# Raises ValueError for a formula this version does not know
+def entry_drawing(entry):
+    formula = entry.get("formula", MANDLEBROT)
+    if formula not in FORMULAS:
+        raise ValueError("Unknown formula: %s" % formula)
+    complexRect = ComplexRectangle(*[Decimal(bound) for bound in entry["rect"]])
+    if entry["kind"] == "JuliaDrawing":
+        juliaPoint = ComplexPoint(*entry["juliaPoint"])
+        drawing = JuliaDrawing(None, complexRect, entry["width"], entry["height"], entry["maxIterations"],
+                               entry["cmName"], juliaPoint)
+    else:
+        drawing = Drawing(None, complexRect, entry["width"], entry["height"], entry["maxIterations"], entry["cmName"])
+    drawing.smooth = entry.get("smooth", False)
+    drawing.antialias = int(entry.get("antialias", 1))
+    drawing.formula = formula
+    return drawing
+
+# Read-only view of a buffer stored in a session file, only the pages that are read get loaded
+def map_iterations(savedIterations):
+    path, offset, dtype, shape = savedIterations
+    return np.memmap(path, dtype=np.dtype(dtype), mode="r", offset=offset, shape=tuple(shape))
+
+# The counts of a drawing wherever they are: on the drawing, from a lookup (e.g. the render cache),
+# or still in the session file the drawing was loaded from; None if they have to be recomputed
+def drawing_iterations(drawing, lookup=None):
+    if drawing.iterations is not None:
+        return drawing.iterations
+    if lookup is not None:
+        iterations = lookup(drawing.cache_key())
+        if iterations is not None:
+            return iterations
+    if drawing.savedIterations is not None:
+        return map_iterations(drawing.savedIterations)
+    return None
+
+# drawings: the current drawing first, then the Previous stack (bottom to top), then the Next stack
+# Written to a temporary file first, drawings mapped from an older version of the file keep working
+# lookup(cacheKey) returns the counts of a history entry or None
+def save_session(path, current, previous, following, lookup=None):
+    path = os.path.abspath(path)
+    drawings = [current] + list(previous) + list(following)
+    entries = [drawing_entry(drawing) for drawing in drawings]
+    buffers = []
+    offset = 0
+    for entry, drawing in zip(entries, drawings):
+        iterations = drawing_iterations(drawing, lookup)
+        if iterations is None:
+            buffers.append(None)
+            continue
+        offset += -offset % BUFFER_ALIGN
+        entry["iterations"] = {"offset": offset, "dtype": iterations.dtype.str, "shape": list(iterations.shape)}
+        buffers.append(iterations)
+        offset += iterations.nbytes
+    header = json.dumps({"previous": len(previous), "next": len(following), "drawings": entries}).encode()
+    start = len(MAGIC) + 8 + len(header)
+    start += -start % BUFFER_ALIGN
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as output:
+        output.write(MAGIC + struct.pack("<Q", len(header)) + header)
+        for entry, iterations in zip(entries, buffers):
+            if iterations is None:
+                continue
+            output.seek(start + entry["iterations"]["offset"])
+            output.write(np.ascontiguousarray(iterations).tobytes())
+    os.replace(temporary, path)
+    for entry, drawing in zip(entries, drawings):
+        if entry["iterations"] is not None:
+            info = entry["iterations"]
+            drawing.savedIterations = (path, start + info["offset"], info["dtype"], info["shape"])
+
+# Exactly length bytes from a session file, a shorter read means the file was cut off
+def read_exactly(session, length, path):
+    data = session.read(length)
+    if len(data) != length:
+        raise ValueError("Truncated session file: " + path)
+    return data
+
+# Returns (current, previous, following) drawings without images or counts, see map_iterations
+# Raises ValueError for files that are not sessions, truncated or malformed
+def load_session(path):
+    path = os.path.abspath(path)
+    with open(path, "rb") as session:
+        if session.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a fractal session file: " + path)
+        headerLength, = struct.unpack("<Q", read_exactly(session, 8, path))
+        fileSize = os.fstat(session.fileno()).st_size
+        if len(MAGIC) + 8 + headerLength > fileSize:
+            raise ValueError("Truncated session file: " + path)
+        header = json.loads(read_exactly(session, headerLength, path))
+    start = len(MAGIC) + 8 + headerLength
+    start += -start % BUFFER_ALIGN
+    try:
+        drawings = []
+        for entry in header["drawings"]:
+            drawing = entry_drawing(entry)
+            info = entry["iterations"]
+            if info is not None:
+                offset = start + int(info["offset"])
+                shape = [int(size) for size in info["shape"]]
+                if shape != [drawing.height, drawing.width]:
+                    raise ValueError("buffer shape %s does not match the drawing" % shape)
+                if offset + np.dtype(info["dtype"]).itemsize * drawing.width * drawing.height > fileSize:
+                    raise ValueError("Truncated session file: " + path)
+                drawing.savedIterations = (path, offset, info["dtype"], shape)
+            drawings.append(drawing)
+        numPrevious = int(header["previous"])
+        current = drawings[0]
+    except (KeyError, IndexError, TypeError, ArithmeticError) as error:
+        raise ValueError("Malformed session file %s: %r" % (path, error))
+    return current, drawings[1:1 + numPrevious], drawings[1 + numPrevious:]
@@ -0,0 +1,145 @@
+# TileRenderer for Fractal Application
+# Splits a Drawing into tiles and computes them on a pool of worker processes
+# Workers write iteration counts straight into a shared-memory buffer, only tile coordinates travel back
+import copy
+import os
+import multiprocessing
+import time
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from FractalCalculator import RenderCancelled, apply_mirror
+
+TILE_SIZE = 64
+POLL_SECONDS = 0.05
+# Workers are started from a fresh process, never forked from the (possibly threaded, Qt) parent
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Per-process state, so a worker attaches to each render's buffer only once
+_worker = {"name": None, "shm": None, "buffer": None, "generation": None}
+
+def _init_worker(generation):
+    _worker["generation"] = generation
+
+def _attach(shmName, shape, dtype):
+    if _worker["name"] != shmName:
+        if _worker["shm"] is not None:
+            _worker["shm"].close()
+        shm = shared_memory.SharedMemory(name=shmName)
+        _worker["name"] = shmName
+        _worker["shm"] = shm
+        _worker["buffer"] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    return _worker["buffer"]
+
+def _render_tile(task):
+    shmName, shape, dtype, calculator, origin, tile, generation = task
+    # Tiles queued for a cancelled render are skipped without touching its buffer
+    if _worker["generation"].value != generation:
+        return None
+    try:
+        buffer = _attach(shmName, shape, dtype)
+    except FileNotFoundError:
+        return None
+    x0, y0, w, h = tile
+    originX, originY = origin
+    buffer[y0:y0+h, x0:x0+w] = calculator.compute_iterations(originX + x0, originY + y0, w, h)
+    return calculator.shortcuts
+
+def make_tiles(width, height, tileSize=TILE_SIZE):
+    tiles = []
+    for y0 in range(0, height, tileSize):
+        for x0 in range(0, width, tileSize):
+            tiles.append((x0, y0, min(tileSize, width - x0), min(tileSize, height - y0)))
+    return tiles
+
+class TileRenderer():
+    def __init__(self, numWorkers=None, tileSize=TILE_SIZE):
+        if numWorkers is None:
+            numWorkers = os.cpu_count() or 1
+        self.numWorkers = numWorkers
+        self.tileSize = tileSize
+        self.pool = None
+        self.generation = None
+
+    def start(self):
+        if self.pool is None:
+            # Workers must share the parent's resource tracker, or each would "clean up" the buffers at exit
+            resource_tracker.ensure_running()
+            context = multiprocessing.get_context(START_METHOD)
+            self.generation = context.Value("l", 0)
+            self.pool = context.Pool(self.numWorkers, _init_worker, (self.generation,))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    # Iteration counts for the pixel rectangle (x0,y0,w,h) of the drawing, the whole drawing by default
+    def compute_iterations(self, calculator, x0=0, y0=0, w=None, h=None):
+        drawing = calculator.drawing
+        if w is None:
+            w = drawing.width - x0
+        if h is None:
+            h = drawing.height - y0
+        shape = (h, w)
+        if self.numWorkers <= 1:
+            return calculator.compute_iterations(x0, y0, w, h)
+        self.start()
+        cancel = calculator.cancel
+        generation = self.generation.value
+        calculator.prepare()
+        # Workers only need the drawing parameters and calculator options, not the QImage
+        spec = copy.copy(drawing)
+        spec.image = None
+        spec.iterations = None
+        workerCalculator = calculator.with_drawing(spec)
+        workerCalculator.cancel = None
+        workerCalculator.stats = None
+        dtype = calculator.count_dtype() # both count types are 4 bytes
+        shm = shared_memory.SharedMemory(create=True, size=max(1, w * h * 4))
+        try:
+            buffer = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            tiles, mirror = self.plan_tiles(calculator, x0, y0, w, h)
+            tasks = [(shm.name, shape, dtype, workerCalculator, (x0, y0), tile, generation) for tile in tiles]
+            # chunksize 1: boundary tiles cost far more than exterior ones, so hand them out one at a time
+            results = self.pool.imap_unordered(_render_tile, tasks, chunksize=1)
+            remaining = len(tasks)
+            while remaining > 0:
+                if cancel is not None and cancel():
+                    with self.generation.get_lock():
+                        self.generation.value += 1
+                    raise RenderCancelled()
+                try:
+                    shortcuts = results.next(POLL_SECONDS)
+                    if shortcuts is not None:
+                        calculator.add_shortcuts(shortcuts)
+                    remaining -= 1
+                except multiprocessing.TimeoutError:
+                    pass
+            iterations = buffer.copy()
+            del buffer
+            if mirror is not None:
+                apply_mirror(iterations, mirror)
+        finally:
+            shm.close()
+            shm.unlink()
+        return iterations
+
+    # Tiles over the pixels the calculator has to compute in the rectangle (x0,y0,w,h), relative to (x0, y0),
+    # and the mirror copy that fills in the rest (see FractalCalculator.symmetry_plan), or None
+    def plan_tiles(self, calculator, x0, y0, w, h):
+        plan = calculator.symmetry_plan(x0, y0, w, h)
+        if plan is None:
+            return make_tiles(w, h, self.tileSize), None
+        rects, mirror = plan
+        tiles = []
+        for rx, ry, rw, rh in rects:
+            tiles.extend((rx + tx, ry + ty, tw, th) for tx, ty, tw, th in make_tiles(rw, rh, self.tileSize))
+        return tiles, mirror
+
+    def plot_image(self, calculator, colorManager):
+        start = time.perf_counter()
+        iterations = self.compute_iterations(calculator)
+        if calculator.stats is not None:
+            calculator.stats.add_phase("iterate", start)
+        calculator.show_iterations(iterations, colorManager)
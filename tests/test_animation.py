@@ -0,0 +1,44 @@
+# Animation frames: ordered, with a bounded number of frame groups in flight, stopped at the zoom limit
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+import pytest
+from ColorManager import *
+from Formulas import BURNING_SHIP
+from FractalAnimation import frames_before_limit, make_frame_drawing, ordered_results
+from FractalRenderer import at_zoom_limit
+
+def test_ordered_results_bounded():
+    started = []
+    lock = threading.Lock()
+    def work(n):
+        with lock:
+            started.append(n)
+        time.sleep(0.001 * (n % 3))
+        return n * n
+    window = 3
+    results = []
+    with ThreadPool(4) as pool:
+        for value in ordered_results(pool, work, range(20), window):
+            time.sleep(0.005) # a slow writer
+            with lock:
+                assert len(started) - len(results) <= window
+            results.append(value)
+    assert results == [n * n for n in range(20)]
+
+def zoom_spec(fractal):
+    return {"target": ("-1.76", "-0.03"), "zoom": "10", "startWidth": "4", "fractal": fractal, "julia": ("0", "0"),
+            "size": (64, 48), "colormap": INITIAL_COLORMAP}
+
+@pytest.mark.parametrize("fractal", [MANDLEBROT, BURNING_SHIP])
+def test_frames_stop_at_zoom_limit(fractal):
+    spec = zoom_spec(fractal)
+    frames = frames_before_limit(spec, 30)
+    if fractal == MANDLEBROT:
+        assert frames == 30 # deep zoom, no limit
+        return
+    assert 0 < frames < 30
+    assert not at_zoom_limit(make_frame_drawing(spec, frames - 1, 64, 48))
+    # Frames past the limit are widened to it, never rendered blocky
+    drawing = make_frame_drawing(spec, 29, 64, 48)
+    assert at_zoom_limit(drawing)
@@ -0,0 +1,38 @@
+# Antialiased pans: the shifted edge samples match freshly computed ones, only the new strips are supersampled
+import numpy as np
+import pytest
+from ColorManager import *
+from FractalRenderer import make_calculator, make_rectangle, pan_rectangle
+
+WIDTH = 200
+HEIGHT = 150
+GRID = 3
+
+def antialiased_calculator(complexRect):
+    calculator = make_calculator(Drawing(None, complexRect, WIDTH, HEIGHT, 300, INITIAL_COLORMAP))
+    calculator.antialias = GRID
+    return calculator
+
+@pytest.mark.parametrize("dx,dy", [(40, 0), (0, -40), (-25, 30), (WIDTH, 0)])
+def test_panned_samples_match_fresh(dx, dy):
+    calculator = antialiased_calculator(make_rectangle("-0.745", "0.11", "0.05", WIDTH, HEIGHT))
+    iterations = calculator.compute_iterations()
+    samples = calculator.sample_edges(iterations)
+    pannedRect = pan_rectangle(calculator.drawing.fractalRect, dx, dy, WIDTH)
+    panned = antialiased_calculator(pannedRect)
+    pannedIterations = panned.compute_panned(iterations, dx, dy)
+    index, counts = panned.sample_panned(pannedIterations, samples, dx, dy)
+    fresh = antialiased_calculator(pannedRect)
+    freshIndex, freshCounts = fresh.sample_edges(pannedIterations)
+    assert np.array_equal(index, freshIndex)
+    assert np.array_equal(counts, freshCounts)
+    if abs(dx) < WIDTH:
+        assert panned.refinedPixels < fresh.refinedPixels / 2
+
+def test_other_grid_is_resampled():
+    calculator = antialiased_calculator(make_rectangle("-0.745", "0.11", "0.05", WIDTH, HEIGHT))
+    iterations = calculator.compute_iterations()
+    samples = calculator.sample_edges(iterations)
+    calculator.antialias = GRID + 1
+    index, counts = calculator.sample_panned(iterations, samples, 0, 0)
+    assert counts.shape[1:] == (GRID + 1, GRID + 1)
@@ -0,0 +1,74 @@
+# Perturbation calculators against an exact Decimal loop on small deep views
+import decimal
+from decimal import Decimal
+import numpy as np
+import pytest
+from ColorManager import *
+from DeepZoom import DeepJuliaCalculator, DeepMandlebrotCalculator
+from FractalCalculator import MandlebrotCalculator
+from FractalRenderer import make_calculator, make_rectangle
+
+WIDTH = 32
+HEIGHT = 24
+MAX_ITERATIONS = 1000
+JULIA_POINT = ComplexPoint(-0.7269, 0.1889)
+EXACT_DIGITS = 60
+
+def deep_drawing(julia, centerR, centerI, complexWidth):
+    rect = make_rectangle(Decimal(centerR), Decimal(centerI), Decimal(complexWidth), WIDTH, HEIGHT)
+    if julia:
+        drawing = JuliaDrawing(None, rect, WIDTH, HEIGHT, MAX_ITERATIONS, INITIAL_COLORMAP, JULIA_POINT)
+    else:
+        drawing = Drawing(None, rect, WIDTH, HEIGHT, MAX_ITERATIONS, INITIAL_COLORMAP)
+    drawing.smooth = False
+    return drawing
+
+def deep_calculator(drawing):
+    return DeepJuliaCalculator(drawing) if isinstance(drawing, JuliaDrawing) else DeepMandlebrotCalculator(drawing)
+
+# Escape counts of every pixel iterated in EXACT_DIGITS digits, counted like test_point
+def exact_counts(calculator):
+    drawing = calculator.drawing
+    counts = np.zeros((drawing.height, drawing.width), dtype=np.int64)
+    with decimal.localcontext() as context:
+        context.prec = EXACT_DIGITS
+        for y in range(drawing.height):
+            for x in range(drawing.width):
+                zR, zI = calculator.pixel_value(x, y)
+                if isinstance(drawing, JuliaDrawing):
+                    cR, cI = Decimal(drawing.juliaPoint.real), Decimal(drawing.juliaPoint.imaginary)
+                else:
+                    cR, cI = zR, zI
+                for i in range(1, drawing.maxIterations):
+                    zR, zI = zR * zR - zI * zI + cR, 2 * zR * zI + cI
+                    if zR * zR + zI * zI >= 4:
+                        counts[y, x] = i
+                        break
+    return counts
+
+# Views whose center reference escapes before some pixels do: they need more references
+GLITCH_VIEWS = [(False, "-1.25066", "0.02012", "1e-7"), (True, "-0.74364", "0.13182", "1e-7")]
+DEEP_VIEWS = [(False, "-0.74364", "0.13182", "1e-12"), (True, "-0.74364", "0.13182", "1e-12")]
+
+@pytest.mark.parametrize("julia,centerR,centerI,complexWidth", GLITCH_VIEWS + DEEP_VIEWS)
+def test_matches_exact_loop(julia, centerR, centerI, complexWidth):
+    calculator = deep_calculator(deep_drawing(julia, centerR, centerI, complexWidth))
+    counts = calculator.compute_iterations()
+    assert np.array_equal(counts, exact_counts(calculator))
+    assert calculator.shortcuts["seriesIterations"] > 0
+
+@pytest.mark.parametrize("julia,centerR,centerI,complexWidth", GLITCH_VIEWS)
+def test_glitches_get_new_references(julia, centerR, centerI, complexWidth):
+    calculator = deep_calculator(deep_drawing(julia, centerR, centerI, complexWidth))
+    calculator.compute_iterations()
+    assert calculator.shortcuts["glitches"] > 0
+    assert calculator.shortcuts["references"] > 1
+
+# Below DEEP_ZOOM_DELTA float64 pixel coordinates are off, perturbation is not
+def test_float64_fails_where_deep_zoom_starts():
+    drawing = deep_drawing(False, *DEEP_VIEWS[0][1:])
+    calculator = make_calculator(drawing)
+    assert isinstance(calculator, DeepMandlebrotCalculator)
+    expected = exact_counts(calculator)
+    assert np.array_equal(calculator.compute_iterations(), expected)
+    assert not np.array_equal(MandlebrotCalculator(drawing).compute_iterations(), expected)
@@ -0,0 +1,44 @@
+# Vectorized escape-time loop against the scalar test_point loop, with and without its shortcuts
+import numpy as np
+import pytest
+from ColorManager import *
+from FractalCalculator import JuliaCalculator, MandlebrotCalculator
+
+WIDTH = 64
+HEIGHT = 48
+BOUNDARY = ComplexRectangle(-0.7, -0.8, 0.15, 0.075) # mostly filaments and bulb edges
+
+def make_drawing(julia, rect):
+    if julia:
+        return JuliaDrawing(None, rect, WIDTH, HEIGHT, 300, INITIAL_COLORMAP, ComplexPoint(-0.12, 0.75))
+    return Drawing(None, rect, WIDTH, HEIGHT, 300, INITIAL_COLORMAP)
+
+def scalar_counts(calculator):
+    zR, zI = calculator.complex_grid(np.arange(WIDTH)[np.newaxis, :], np.arange(HEIGHT)[:, np.newaxis])
+    zR, zI = np.broadcast_arrays(zR, zI)
+    counts = np.zeros((HEIGHT, WIDTH), dtype=np.int64)
+    for y in range(HEIGHT):
+        for x in range(WIDTH):
+            counts[y, x] = calculator.test_point(float(zR[y, x]), float(zI[y, x]), calculator.drawing.maxIterations)
+    return counts
+
+@pytest.mark.parametrize("julia", [False, True])
+@pytest.mark.parametrize("rectName", ["initial", "boundary"])
+@pytest.mark.parametrize("cardioidCheck", [False, True])
+@pytest.mark.parametrize("periodicityCheck", [False, True])
+def test_vector_matches_scalar(julia, rectName, cardioidCheck, periodicityCheck):
+    if rectName == "boundary":
+        rect = BOUNDARY
+    else:
+        rect = INITIAL_JULIA_RECTANGLE if julia else INITIAL_MANDLEBROT_RECTANGLE
+    drawing = make_drawing(julia, rect)
+    calculator = JuliaCalculator(drawing) if julia else MandlebrotCalculator(drawing)
+    calculator.cardioidCheck = cardioidCheck
+    calculator.periodicityCheck = periodicityCheck
+    counts = calculator.compute_iterations()
+    # The shortcuts that are on do fire on the initial views, so the comparison covers them
+    if rectName == "initial":
+        assert (calculator.shortcuts["periodicity"] > 0) == periodicityCheck
+        if not julia:
+            assert (calculator.shortcuts["cardioid"] > 0) == cardioidCheck
+    assert np.array_equal(counts, scalar_counts(calculator))
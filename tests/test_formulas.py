@@ -0,0 +1,99 @@
+# Formula registry: kernels against scalar reference loops, flipped views, zoom limits
+import numpy as np
+import pytest
+from ColorManager import *
+from Formulas import BURNING_SHIP, MULTIBROT, TRICORN, new_drawing
+from DeepZoom import needs_deep_zoom
+from FractalRenderer import ZOOM_LIMIT_DELTA, at_zoom_limit, limit_zoom, make_calculator, make_rectangle, pan_rectangle, zoom_rectangle
+
+MAX_ITERATIONS = 200
+
+# One step of each formula on plain floats, written out from its definition
+def multibrot(power):
+    def step(zR, zI, cR, cI):
+        wR, wI = zR, zI
+        for n in range(power - 1):
+            wR, wI = wR * zR - wI * zI, wR * zI + wI * zR
+        return wR + cR, wI + cI
+    return step
+
+def burning_ship(zR, zI, cR, cI):
+    return zR * zR - zI * zI + cR, 2 * abs(zR * zI) + cI
+
+def tricorn(zR, zI, cR, cI):
+    return zR * zR - zI * zI + cR, -2 * zR * zI + cI
+
+REFERENCES = {MULTIBROT % 3: multibrot(3), MULTIBROT % 4: multibrot(4), MULTIBROT % 5: multibrot(5),
+              BURNING_SHIP: burning_ship, TRICORN: tricorn}
+
+# First iteration with |z|^2 >= 4, or 0 if the point never escapes
+def reference_count(step, zR, zI, cR, cI):
+    for i in range(1, MAX_ITERATIONS):
+        zR, zI = step(zR, zI, cR, cI)
+        if zR * zR + zI * zI >= 4:
+            return i
+    return 0
+
+def sample_points():
+    generator = np.random.default_rng(22)
+    points = generator.uniform(-2, 2, (2, 400))
+    edge = generator.uniform(-0.01, 0.01, (2, 100)) + np.array([[-0.75], [0.1]]) # near the boundary
+    return np.concatenate([points, edge], axis=1)
+
+@pytest.mark.parametrize("fractalName", sorted(REFERENCES))
+def test_kernel_matches_reference(fractalName):
+    drawing = new_drawing(fractalName, None, INITIAL_MANDLEBROT_RECTANGLE, 10, 10, MAX_ITERATIONS, INITIAL_COLORMAP)
+    calculator = make_calculator(drawing)
+    calculator.periodicityCheck = False
+    cR, cI = sample_points()
+    counts = calculator.iterate(cR, cI, MAX_ITERATIONS)
+    step = REFERENCES[fractalName]
+    expected = [reference_count(step, r, i, r, i) for r, i in zip(cR.tolist(), cI.tolist())]
+    assert counts.tolist() == expected
+
+@pytest.mark.parametrize("fractalName", sorted(REFERENCES))
+def test_julia_kernel_matches_reference(fractalName):
+    juliaPoint = ComplexPoint(-0.12, 0.75)
+    drawing = new_drawing(fractalName + " Julia", None, INITIAL_JULIA_RECTANGLE, 10, 10, MAX_ITERATIONS,
+                          INITIAL_COLORMAP, juliaPoint)
+    calculator = make_calculator(drawing)
+    calculator.periodicityCheck = False
+    zR, zI = sample_points()
+    counts = calculator.iterate(zR.copy(), zI.copy(), MAX_ITERATIONS)
+    step = REFERENCES[fractalName]
+    expected = [reference_count(step, r, i, juliaPoint.real, juliaPoint.imaginary)
+                for r, i in zip(zR.tolist(), zI.tolist())]
+    assert counts.tolist() == expected
+
+# A zoom or pan shows the same complex points at their new pixels, whichever way the imaginary axis points
+@pytest.mark.parametrize("fractalName", [BURNING_SHIP, TRICORN])
+def test_zoom_and_pan_follow_the_view(fractalName):
+    drawing = new_drawing(fractalName, None, INITIAL_MANDLEBROT_RECTANGLE, 300, 300, 100, INITIAL_COLORMAP)
+    flipped = make_calculator(drawing).flipImaginary
+    assert flipped == (fractalName == BURNING_SHIP)
+    parent = make_calculator(drawing)
+    zoomed = new_drawing(fractalName, None, zoom_rectangle(drawing.fractalRect, PixelRectangle(30, 40, 100, 100),
+                         300, 300, flipped), 300, 300, 100, INITIAL_COLORMAP)
+    zR, zI = make_calculator(zoomed).complex_grid(np.array([0, 300]), np.array([0, 300]))
+    pR, pI = parent.complex_grid(np.array([30, 130]), np.array([40, 140]))
+    assert np.allclose(zR, pR) and np.allclose(zI, pI)
+    panned = new_drawing(fractalName, None, pan_rectangle(drawing.fractalRect, 7, 11, 300, flipped),
+                         300, 300, 100, INITIAL_COLORMAP)
+    zR, zI = make_calculator(panned).complex_grid(np.array([0]), np.array([0]))
+    pR, pI = parent.complex_grid(np.array([7]), np.array([11]))
+    assert np.allclose(zR, pR) and np.allclose(zI, pI)
+
+# Formulas without a perturbation engine stop at the smallest pixel size float64 renders cleanly
+@pytest.mark.parametrize("fractalName", [MANDLEBROT, BURNING_SHIP, TRICORN + " Julia"])
+def test_zoom_limit(fractalName):
+    deep = make_rectangle("-1.7", "-0.03", "1e-12", 300, 200)
+    limited = limit_zoom(fractalName, deep, 300, 200)
+    if fractalName == MANDLEBROT:
+        assert limited is deep
+        return
+    drawing = new_drawing(fractalName, None, limited, 300, 200, 100, INITIAL_COLORMAP, ComplexPoint(-0.12, 0.75))
+    assert not needs_deep_zoom(drawing) and at_zoom_limit(drawing)
+    assert float(limited.rMax - limited.rMin) == pytest.approx(float(ZOOM_LIMIT_DELTA) * 300)
+    assert float(limited.iMax + limited.iMin) / 2 == pytest.approx(-0.03)
+    shallow = make_rectangle("-1.7", "-0.03", "0.1", 300, 200)
+    assert limit_zoom(fractalName, shallow, 300, 200) is shallow
@@ -0,0 +1,93 @@
+# Several RenderServer processes on ephemeral localhost ports, one killed mid-render
+import os
+import socket
+import subprocess
+import sys
+import numpy as np
+import pytest
+from ColorManager import *
+from FractalRenderer import make_calculator
+from RemoteRenderer import RemoteTileRenderer, job_spec, parse_address, read_message, send_message
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def start_server(*options):
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "RenderServer.py"), "--port", "0", *options],
+                               stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline() # "Render server listening on 127.0.0.1:PORT"
+    return process, "127.0.0.1:" + line.strip().rsplit(":", 1)[1]
+
+@pytest.fixture
+def servers():
+    started = [start_server() for n in range(3)]
+    yield started
+    for process, address in started:
+        process.kill()
+        process.wait()
+
+def make_drawing(julia):
+    if julia:
+        return JuliaDrawing(None, INITIAL_JULIA_RECTANGLE, 256, 192, 400, INITIAL_COLORMAP, ComplexPoint(-0.12, 0.75))
+    return Drawing(None, INITIAL_MANDLEBROT_RECTANGLE, 256, 192, 400, INITIAL_COLORMAP)
+
+@pytest.mark.parametrize("julia", [False, True])
+def test_remote_render_matches_local(servers, julia):
+    drawing = make_drawing(julia)
+    renderer = RemoteTileRenderer([address for process, address in servers], tileSize=32)
+    counts = renderer.compute_iterations(make_calculator(drawing))
+    assert np.array_equal(counts, make_calculator(drawing).compute_iterations())
+    assert not renderer.failedServers
+
+def test_server_killed_mid_render(servers):
+    drawing = make_drawing(False)
+    renderer = RemoteTileRenderer([address for process, address in servers], tileSize=16)
+    calculator = make_calculator(drawing)
+    polls = []
+    # cancel is polled while the results come in: kill a server once the render is under way
+    def kill_one():
+        polls.append(1)
+        if len(polls) == 3:
+            servers[0][0].kill()
+        return False
+    calculator.cancel = kill_one
+    counts = renderer.compute_iterations(calculator)
+    assert len(polls) > 3
+    assert list(renderer.failedServers) == [parse_address(servers[0][1])]
+    assert np.array_equal(counts, make_calculator(drawing).compute_iterations())
+
+def test_refused_tile_keeps_connection(servers):
+    drawing = make_drawing(False)
+    job = {"spec": job_spec(make_calculator(drawing))}
+    with socket.create_connection(parse_address(servers[0][1]), timeout=10) as connection:
+        send_message(connection, dict(job, tile=[0, 0, 1 << 12, 1 << 12]))
+        header, payload = read_message(connection)
+        assert "error" in header
+        send_message(connection, dict(job, tile=[0, 0, 8, 8]))
+        header, payload = read_message(connection)
+        assert header["shape"] == [8, 8]
+
+def test_all_servers_gone(servers):
+    for process, address in servers:
+        process.kill()
+        process.wait()
+    drawing = make_drawing(True)
+    renderer = RemoteTileRenderer([address for process, address in servers])
+    counts = renderer.compute_iterations(make_calculator(drawing))
+    assert np.array_equal(counts, make_calculator(drawing).compute_iterations())
+
+def test_slow_tile_keeps_server():
+    process, address = start_server("--heartbeat", "0.1")
+    try:
+        # Interior points with no shortcuts: one tile takes longer than the client timeout
+        drawing = Drawing(None, ComplexRectangle(-0.1, -0.3, 0.1, -0.1), 64, 64, 40000, INITIAL_COLORMAP)
+        calculator = make_calculator(drawing)
+        calculator.cardioidCheck = False
+        calculator.periodicityCheck = False
+        calculator.subdivide = False
+        renderer = RemoteTileRenderer([address], tileSize=64, timeout=0.3)
+        counts = renderer.compute_iterations(calculator)
+        assert not renderer.failedServers
+        assert not counts.any() # all interior
+    finally:
+        process.kill()
+        process.wait()
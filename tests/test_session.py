@@ -0,0 +1,51 @@
+# Session files: round trip, and clean errors for truncated or malformed files
+import json
+import struct
+import numpy as np
+import pytest
+from ColorManager import *
+from FractalRenderer import make_calculator
+from Session import MAGIC, load_session, map_iterations, save_session
+
+def rendered(drawing):
+    drawing.set_iterations(make_calculator(drawing).compute_iterations())
+    return drawing
+
+@pytest.fixture
+def sessionFile(tmp_path):
+    current = rendered(Drawing(None, INITIAL_MANDLEBROT_RECTANGLE, 64, 48, 100, INITIAL_COLORMAP))
+    previous = rendered(JuliaDrawing(None, INITIAL_JULIA_RECTANGLE, 64, 48, 100, INITIAL_COLORMAP,
+                                     ComplexPoint(-0.12, 0.75)))
+    path = str(tmp_path / "saved.fractal")
+    save_session(path, current, [previous], [])
+    return path, current, previous
+
+def test_round_trip(sessionFile):
+    path, current, previous = sessionFile
+    loadedCurrent, loadedPrevious, following = load_session(path)
+    assert np.array_equal(map_iterations(loadedCurrent.savedIterations), current.iterations)
+    assert np.array_equal(map_iterations(loadedPrevious[0].savedIterations), previous.iterations)
+    assert loadedPrevious[0].cache_key() == previous.cache_key()
+    assert following == []
+
+def test_truncated_file(sessionFile, tmp_path):
+    path = sessionFile[0]
+    with open(path, "rb") as session:
+        data = session.read()
+    for length in (len(MAGIC) + 3, len(MAGIC) + 20, len(data) - 100):
+        truncated = tmp_path / ("truncated%d.fractal" % length)
+        truncated.write_bytes(data[:length])
+        with pytest.raises(ValueError):
+            load_session(str(truncated))
+
+@pytest.mark.parametrize("header", [[], {"drawings": []}, {"previous": 0, "drawings": [{"kind": "Drawing"}]},
+                                    {"previous": 0, "drawings": [{"kind": "Drawing", "rect": ["x", 0, 0, 0]}]},
+                                    {"previous": 0, "drawings": [{"kind": "Drawing", "formula": "Nope",
+                                     "rect": [1, -1, 1, -1], "width": 4, "height": 4, "maxIterations": 10,
+                                     "cmName": INITIAL_COLORMAP, "iterations": None}]}])
+def test_malformed_header(tmp_path, header):
+    data = json.dumps(header).encode()
+    path = tmp_path / "malformed.fractal"
+    path.write_bytes(MAGIC + struct.pack("<Q", len(data)) + data)
+    with pytest.raises(ValueError):
+        load_session(str(path))
@@ -0,0 +1,18 @@
+# Continuous counts: escaped points stay above the interior count 0 and agree with the integer counts
+import numpy as np
+import pytest
+from ColorManager import *
+from Formulas import MULTIBROT, new_drawing
+from FractalRenderer import make_calculator
+
+WIDE = ComplexRectangle(4.0, -4.0, 3.0, -3.0) # large |c|: the first step overshoots the bailout far
+
+@pytest.mark.parametrize("fractalName", [MANDLEBROT, MULTIBROT % 5, JULIA])
+def test_smooth_counts_positive(fractalName):
+    drawing = new_drawing(fractalName, None, WIDE, 160, 120, 100, INITIAL_COLORMAP, ComplexPoint(-0.12, 0.75))
+    counts = make_calculator(drawing).compute_iterations()
+    drawing.smooth = True
+    smooth = make_calculator(drawing).compute_iterations()
+    assert np.array_equal(smooth == 0, counts == 0)
+    assert smooth[counts != 0].min() > 0
+    assert (smooth <= counts + 1).all()
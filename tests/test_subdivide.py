@@ -0,0 +1,28 @@
+# Mariani-Silver subdivision against brute force
+import pytest
+from ColorManager import *
+from FractalRenderer import make_calculator
+
+MANDLEBROT_VIEWS = [(INITIAL_MANDLEBROT_RECTANGLE, 200, 150),
+                    (ComplexRectangle(0.45, 0.25, 0.1, -0.1), 200, 150),
+                    (ComplexRectangle(-0.5, -1.0, 0.3, -0.2), 200, 150),
+                    (ComplexRectangle(-0.1, -0.2, 1.05, 0.95), 640, 480)]
+JULIA_VIEWS = [(ComplexPoint(-0.12, 0.75), INITIAL_JULIA_RECTANGLE, 200, 150),
+               (ComplexPoint(-0.8, 0.156), INITIAL_JULIA_RECTANGLE, 320, 240),
+               (ComplexPoint(-0.12, 0.75), ComplexRectangle(0.5, -0.5, 0.5, -0.5), 200, 150),
+               (ComplexPoint(-0.8, 0.156), ComplexRectangle(0.2, 0.0, 0.9, 0.7), 200, 150)]
+
+@pytest.mark.parametrize("rect, w, h", MANDLEBROT_VIEWS)
+def test_mandlebrot_subdivision_exact(rect, w, h):
+    assert make_calculator(Drawing(None, rect, w, h, 300, INITIAL_COLORMAP)).subdivision_mismatches() == 0
+
+@pytest.mark.parametrize("juliaPoint, rect, w, h", JULIA_VIEWS)
+def test_julia_subdivision_exact(juliaPoint, rect, w, h):
+    drawing = JuliaDrawing(None, rect, w, h, 300, INITIAL_COLORMAP, juliaPoint)
+    assert make_calculator(drawing).subdivision_mismatches() == 0
+
+# Filaments thinner than a pixel can cross a uniform border between samples: bounded, not exact
+@pytest.mark.parametrize("rect", [INITIAL_MANDLEBROT_RECTANGLE, ComplexRectangle(-0.7, -0.8, 0.2, 0.1)])
+def test_filament_mismatches_rare(rect):
+    drawing = Drawing(None, rect, 640, 480, 300, INITIAL_COLORMAP)
+    assert make_calculator(drawing).subdivision_mismatches() <= 640 * 480 // 1000
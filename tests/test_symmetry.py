@@ -0,0 +1,52 @@
+# Mirror-symmetric pixels are copied, not computed: renders must match the non-mirrored ones exactly
+import numpy as np
+import pytest
+from ColorManager import *
+from Formulas import new_drawing, BURNING_SHIP, JULIA_SUFFIX, TRICORN
+from FractalRenderer import make_calculator
+from TileRenderer import TileRenderer
+
+JULIA_POINT = ComplexPoint(-0.12, 0.75)
+
+# (fractal, view, width, height, mirrored): mirrored views have their symmetry axes on the pixel grid
+VIEWS = [(MANDLEBROT, INITIAL_MANDLEBROT_RECTANGLE, 200, 150, True),
+         (MANDLEBROT, ComplexRectangle(0.5, -2.0, 1.0, -0.5), 200, 150, True),
+         (MANDLEBROT, ComplexRectangle(-0.5, -1.0, 0.3, -0.2), 200, 150, False),
+         (MANDLEBROT, ComplexRectangle(0.5, -2.0, 1.0, -0.7123), 200, 150, False),
+         (JULIA, INITIAL_JULIA_RECTANGLE, 200, 150, True),
+         (JULIA, ComplexRectangle(1.0, -0.5, 0.75, -0.75), 150, 120, True),
+         (JULIA, ComplexRectangle(1.0, -0.6123, 0.8, -0.3), 200, 150, False),
+         (TRICORN, INITIAL_JULIA_RECTANGLE, 200, 150, True),
+         (BURNING_SHIP + JULIA_SUFFIX, INITIAL_JULIA_RECTANGLE, 200, 150, True)]
+
+def calculators(fractalName, rect, w, h):
+    drawing = new_drawing(fractalName, None, rect, w, h, 200, INITIAL_COLORMAP, JULIA_POINT)
+    mirrored = make_calculator(drawing)
+    computed = make_calculator(drawing)
+    computed.symmetry = False
+    return mirrored, computed
+
+@pytest.mark.parametrize("fractalName, rect, w, h, mirrored", VIEWS)
+def test_mirrored_render_matches(fractalName, rect, w, h, mirrored):
+    calculator, reference = calculators(fractalName, rect, w, h)
+    assert np.array_equal(calculator.compute_iterations(), reference.compute_iterations())
+    assert (calculator.shortcuts["symmetry"] > 0) == mirrored
+    assert reference.shortcuts["symmetry"] == 0
+
+@pytest.mark.parametrize("fractalName, rect, w, h, mirrored", VIEWS)
+def test_mirrored_region_matches(fractalName, rect, w, h, mirrored):
+    calculator, reference = calculators(fractalName, rect, w, h)
+    region = (w // 5, h // 3, w // 2, h // 2)
+    assert np.array_equal(calculator.compute_iterations(*region), reference.compute_iterations(*region))
+
+@pytest.fixture(scope="module")
+def tileRenderer():
+    renderer = TileRenderer(2, tileSize=32)
+    yield renderer
+    renderer.close()
+
+@pytest.mark.parametrize("fractalName, rect, w, h, mirrored", VIEWS)
+def test_tiled_mirrored_render_matches(tileRenderer, fractalName, rect, w, h, mirrored):
+    calculator, reference = calculators(fractalName, rect, w, h)
+    assert np.array_equal(tileRenderer.compute_iterations(calculator), reference.compute_iterations())
+    assert (calculator.shortcuts["symmetry"] > 0) == mirrored